@@ -0,0 +1,157 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import contextlib
+import io
+import os
+import time
+
+import numpy as np
+
+import backtrader as bt
+
+import main
+from columnar import ArrayData, read_csv
+
+
+class AlignedData(ArrayData):
+    '''
+    ``ArrayData`` over one feed of ``align``, with ``filled`` 1.0 on the
+    bars made up to fill its gaps.
+    '''
+    lines = ('filled',)
+
+
+def align(histories, resolution=60):
+    '''
+    Puts the ``{name: (timestamps, columns)}`` bars of ``histories`` on a
+    single master clock, the union of their timestamps floored to
+    ``resolution`` seconds. A bar stamped off the grid, like the running
+    minute at the end of a download, takes the place of its bar; only the
+    last one of a bar is kept.
+
+    Every feed gets a bar on each timestamp of the master clock from its own
+    first bar on. A missing bar is filled with the last close and no volume
+    and marked in the ``filled`` column. Feeds without bars are left out.
+
+    Returns the master timestamps, ``{name: (timestamps, columns)}`` of the
+    aligned feeds and a coverage dict per feed, see ``report``.
+    '''
+    bars, coverage = collections.OrderedDict(), collections.OrderedDict()
+    for name, (timestamps, columns) in histories.items():
+        if not len(timestamps):
+            coverage[name] = dict(bars=0, offgrid=0, merged=0, span=0, filled=0, gaps=0,
+                                  longest=0, first=None, last=None, empty=True)
+            continue
+        order = np.argsort(timestamps, kind='stable')
+        stamps = timestamps[order] // resolution * resolution
+        last = np.append(stamps[1:] != stamps[:-1], True)
+        bars[name] = stamps[last], dict((column, values[order][last]) for column, values in columns.items())
+        coverage[name] = dict(bars=len(timestamps), offgrid=int(np.count_nonzero(timestamps % resolution)),
+                              merged=int(len(timestamps) - np.count_nonzero(last)), empty=False)
+
+    master = np.unique(np.concatenate([stamps for stamps, _ in bars.values()])) if bars else np.empty(0, np.int64)
+
+    aligned = collections.OrderedDict()
+    for name, (stamps, columns) in bars.items():
+        index = master[np.searchsorted(master, stamps[0]):]
+        rows = np.searchsorted(stamps, index, side='right') - 1
+        filled = stamps[rows] != index
+        close = columns['close'][rows]
+        values = dict((column, np.where(filled, close, columns[column][rows])) for column in ('open', 'high', 'low'))
+        values.update(close=close, volume=np.where(filled, 0.0, columns['volume'][rows]),
+                      openinterest=columns['openinterest'][rows], filled=filled.astype(np.float64))
+        aligned[name] = index, values
+
+        # lengths of the runs of filled bars
+        edges = np.diff(np.concatenate(([0], filled.view(np.int8), [0])))
+        runs = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+        coverage[name].update(span=len(index), filled=int(np.count_nonzero(filled)), gaps=len(runs),
+                              longest=int(runs.max()) if len(runs) else 0,
+                              first=int(index[0]), last=int(stamps[-1]))
+    return master, aligned, coverage
+
+
+def report(master, coverage):
+    '''
+    One line per feed: its rows, how many were off the grid and merged
+    into another, the master bars from its first bar on, the share of those
+    it has itself, the bars filled, in how many gaps and the longest one.
+    '''
+    lines = ['master clock: {0} bars'.format(len(master)),
+             '{0:<8} {1:>6} {2:>7} {3:>6} {4:>6} {5:>8} {6:>6} {7:>5} {8:>7}'.format(
+                 'feed', 'rows', 'offgrid', 'merged', 'span', 'coverage', 'filled', 'gaps', 'longest')]
+    for name, stats in coverage.items():
+        if stats['empty']:
+            lines.append('{0:<8} {1:>6}  empty, left out'.format(name, 0))
+            continue
+        lines.append('{0:<8} {1:>6} {2:>7} {3:>6} {4:>6} {5:>8.2%} {6:>6} {7:>5} {8:>7}'.format(
+            name, stats['bars'], stats['offgrid'], stats['merged'], stats['span'],
+            1.0 - stats['filled'] / stats['span'], stats['filled'], stats['gaps'], stats['longest']))
+    return '\n'.join(lines)
+
+
+def parse_data(filenames, resolution=60):
+    '''
+    ``main.parse_data`` on the master clock: the aligned feeds of the
+    non-empty ``filenames``, named after them, and the coverage.
+    '''
+    histories = collections.OrderedDict(
+        (os.path.splitext(os.path.basename(filename))[0], read_csv(filename)) for filename in filenames)
+    master, aligned, coverage = align(histories, resolution)
+    datas = [AlignedData(timestamps=timestamps, columns=columns, name=name)
+             for name, (timestamps, columns) in aligned.items()]
+    return datas, master, coverage
+
+
+def backtest(datas, **kwargs):
+    '''Runs ``main.Strategy`` quietly over ``datas``, returns it and the seconds taken.'''
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(100000)
+    cerebro.addstrategy(main.Strategy, printlog=False, **kwargs)
+    for data in datas:
+        cerebro.adddata(data, name=data.p.name)
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+    return strategy, time.time() - start
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Align the bar files on one master clock, report their coverage '
+        'and backtest main.Strategy over them aligned and as they are')
+
+    parser.add_argument('--tickers', nargs='+', default=main.TICKERS + ['BRK.A'],
+                        help='Tickers whose <ticker>.csv is aligned')
+
+    parser.add_argument('--resolution', type=int, default=60,
+                        help='Bar size of the master clock in seconds')
+
+    parser.add_argument('--nobacktest', action='store_true',
+                        help='Only report the coverage')
+
+    parser.add_argument('--strat', required=False, default='',
+                        metavar='kwargs', help='kwargs in key=value format')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    filenames = ['{0}.csv'.format(ticker) for ticker in args.tickers]
+    datas, master, coverage = parse_data(filenames, args.resolution)
+    print(report(master, coverage))
+
+    if not args.nobacktest:
+        kwargs = eval('dict(' + args.strat + ')')
+        present = [filename for filename in filenames if not coverage[os.path.splitext(filename)[0]]['empty']]
+        for label, feeds in (('as they are', main.parse_data(present)), ('aligned', datas)):
+            strategy, seconds = backtest(feeds, **kwargs)
+            print('{0:<12} {1} bars in {2:.1f}s, value {3:.2f}'.format(
+                label, len(strategy), seconds, strategy.broker.getvalue()))
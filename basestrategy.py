@@ -0,0 +1,355 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import collections
+import time
+
+import trendln as tl
+import backtrader as bt
+
+from journal import dataname
+from profiler import NullProfiler, Profiler
+
+
+class _RewindableQBuffer(bt.linebuffer.LineBuffer):
+    # A data line in qbuffer mode that backtrader can hold back. Feeds gone
+    # past the others on a gap are rewound and advanced again later, but a
+    # full qbuffer only moves its index when forced and its buflen does not
+    # tell there is a bar left, so the feed would show the bar it was held
+    # back from and then load yet another one. Needs an extrasize of 1 to
+    # keep the lookback behind the held bar.
+    held = 0
+
+    def rewind(self, size=1):
+        self.set_idx(self.idx - size, force=True)
+        self.lencount -= size
+        self.held += size
+
+    def advance(self, size=1):
+        super(_RewindableQBuffer, self).advance(size)
+        self.held -= size
+
+    def buflen(self):
+        return self.lencount + self.held
+
+
+class _Bounded(object):
+    # Everything bounded mode does to backtrader's private state: the class
+    # of the data lines and the order, trade and OCO bookkeeping of the
+    # strategy and BackBroker. None of it is API, so it only runs on the
+    # backtrader versions it was checked against and refuses any other.
+    VERSIONS = ((1, 9, 78),)
+
+    def __init__(self):
+        version = tuple(bt.version.__btversion__[:3])
+        if version not in self.VERSIONS:
+            raise RuntimeError(
+                'exactbars > 0 relies on backtrader internals checked against {0} only, not {1}; '
+                'run with exactbars=0 or check BaseStrategy bounded mode against it'.format(
+                    ', '.join('.'.join(map(str, v)) for v in self.VERSIONS), bt.__version__))
+
+    def hold(self, line, lookback):
+        line.__class__ = _RewindableQBuffer
+        line.qbuffer(extrasize=1)
+        line.minbuffer(lookback)
+
+    def clear(self, strategy):
+        strategy._orders = []
+
+    def closed(self, strategy, trade):
+        # only the last trade of a data is ever looked at again
+        del strategy._trades[trade.data][trade.tradeid][:-1]
+
+    def forget(self, broker, order):
+        # drops a finished order from the bookkeeping BackBroker keeps
+        # forever, unless it belongs to a bracket or OCO group
+        if order in broker.orders:
+            broker.orders.remove(order)
+        ref = order.ref
+        if getattr(broker, '_ocol', {}).get(ref) == [ref]:
+            del broker._ocol[ref]
+            broker._ocos.pop(ref, None)
+        pchildren = getattr(broker, '_pchildren', {})
+        if ref in pchildren and not pchildren[ref]:
+            del pchildren[ref]
+
+
+class BaseStrategy(bt.Strategy):
+    '''
+    Common base of the strategies in this repo.
+
+    Keeps the orders still alive for every data, so ``hasorder`` is a dict
+    lookup instead of a scan of ``broker.get_orders_open()`` for each data.
+    Orders are added as soon as ``buy``/``sell`` create them and dropped by
+    ``notify_order`` once completed, canceled, expired or rejected.
+
+    ``fitcache`` takes a ``fitcache.FitCache`` for the trendline fits; its
+    hit and miss counts are printed in ``stop``.
+
+    With ``profile`` set every bar of ``next`` is timed and the subclasses
+    time their phases per feed with ``self.profile(phase, feed)``; the
+    summary is printed in ``stop`` and written as JSON to ``profileout``
+    when given. With it off ``self.profile`` returns a shared no-op and
+    ``next`` is left alone.
+
+    ``log`` prints when ``printlog`` is set. Given a ``journal.Journal``
+    it records every message, order notification and closed trade there
+    instead, plus the bar of every data on each ``next`` with
+    ``journalbars``, and messages reach the console only through the
+    journal console sink.
+
+    With live feeds ``latency`` (a ``Profiler``) gets the time from the
+    arrival of each bar of a ``livefeed.StreamData`` to the end of the
+    ``next`` deciding on it, summarized in ``stop``.
+
+    ``lookback`` is how many bars of every data the strategy reads back,
+    the current one included. Run with ``exactbars=1`` (see ``longrun``),
+    the data lines keep just that many and every other line the minimum
+    backtrader works out. The order notifications, finished orders and
+    closed trades backtrader keeps as history are dropped then too, so
+    memory stays flat however long the history.
+
+    ``snapshot`` returns the state a run ends in: broker cash and, by data
+    name, the position, the open trade, the orders still alive and the last
+    ``lookback`` bars, which is all the rolling fits and windows start from.
+    A run given it as ``resume`` over feeds starting with those very bars
+    (see ``checkpoint``) restores the broker and trades in ``start``,
+    replays the bars without deciding anything and places the orders again
+    right before the first new bar, so it goes on as the first run would
+    have. Only plain orders are carried over, not brackets or OCO groups.
+
+    ``timers`` makes the signals decimated: a list of ``add_timer`` kwargs
+    dicts (``when``, ``offset``, ``repeat``, ``weekdays``, ... as in
+    ``scheduled-min.py``), one timer each. Subclasses then only run their
+    signals on the bars ``evaluate`` says so, the first one on or after a
+    timer went off, while fills and order bookkeeping go on every bar. They
+    count the signals run, one per data, in ``evaluations``. Precomputed
+    signals are fitted on every bar anyway, so this only saves work when
+    they are computed in ``next``.
+
+    Subclasses overriding ``notify_order``, ``notify_trade``, ``start`` or
+    ``stop`` must call them here too; ones with state of their own extend
+    ``snapshot`` and ``restore``.
+    '''
+    params = (
+        ('printlog', True),
+        ('fitcache', None),
+        ('profile', False),
+        ('profileout', None),
+        ('journal', None),
+        ('journalbars', False),
+        ('resume', None),
+        ('timers', None),
+    )
+
+    lookback = 1
+    bounded = None
+    due = False
+    evaluations = 0
+
+    def __init__(self):
+        super(BaseStrategy, self).__init__()
+        self.pending = collections.defaultdict(dict)
+        self.profiler = Profiler() if self.params.profile else NullProfiler()
+        if self.params.journal is not None and self.params.journalbars:
+            self.next = self.snapshots(self.next)
+        self.next = self.profiler.wrap('next', self.next)
+        self.latency = Profiler()
+        self.live = [data for data in self.datas if data.islive()]
+        if self.live:
+            self.next = self.timelatency(self.next)
+        if self.params.resume is not None:
+            self.resuming()
+        for timer in self.params.timers or ():
+            self.add_timer(**timer)
+
+    def snapshots(self, next):
+        journal = self.params.journal
+
+        def journaled():
+            for data in self.datas:
+                journal.bar(data)
+            next()
+        return journaled
+
+    def timelatency(self, next):
+        def timed():
+            next()
+            now = time.perf_counter()
+            for data in self.live:
+                arrival = getattr(data, 'arrival', None)
+                if arrival is not None:
+                    self.latency.add('latency', dataname(data), now - arrival)
+                    data.arrival = None
+        return timed
+
+    def resuming(self):
+        # skips the bars carried over by ``resume`` and places its orders on
+        # the last of them, then hands over to ``next``/``prenext`` for good
+        datas = self.params.resume['datas']
+        carried = [len(datas[dataname(data)]['bars']['datetime']) if dataname(data) in datas else 0
+                   for data in self.datas]
+        next, prenext, placed = self.next, self.prenext, []
+
+        def replaying(call):
+            def replay():
+                lengths = [len(data) for data in self.datas]
+                if all(length <= count for length, count in zip(lengths, carried)):
+                    if lengths == carried and not placed:
+                        placed.append(self.reorder())
+                    return
+                self.next, self.prenext = next, prenext
+                call()
+            return replay
+        self.next, self.prenext = replaying(next), replaying(prenext)
+
+    def qbuffer(self, savemem=0, replaying=False):
+        super(BaseStrategy, self).qbuffer(savemem, replaying=replaying)
+        if savemem > 0:
+            self.bounded = _Bounded()
+            for data in self.datas:
+                for line in data.lines:
+                    self.bounded.hold(line, self.lookback)
+
+    def notify_timer(self, timer, when, *args, **kwargs):
+        self.due = True
+
+    def evaluate(self):
+        '''
+        Whether the signals are run this bar: always without ``timers``,
+        else if one went off since they last were.
+        '''
+        if not self.params.timers: return True
+        due, self.due = self.due, False
+        return due
+
+    def log(self, data, txt, doprint=False):
+        echo = self.params.printlog or doprint
+        if self.params.journal is not None:
+            with self.profile('log'):
+                self.params.journal.message(data.datetime[0], dataname(data), txt, echo)
+        elif echo:
+            with self.profile('log'):
+                datetime = data.datetime
+                date = datetime.date(0)
+                time = datetime.time(0)
+                print('%s, %s, %s' % (date, time, txt))
+
+    def profile(self, phase, feed=None):
+        return self.profiler.phase(phase, feed)
+
+    def buy(self, *args, **kwargs):
+        return self.track(super(BaseStrategy, self).buy(*args, **kwargs))
+
+    def sell(self, *args, **kwargs):
+        return self.track(super(BaseStrategy, self).sell(*args, **kwargs))
+
+    def clear(self):
+        super(BaseStrategy, self).clear()
+        if self.bounded:
+            self.bounded.clear(self)
+
+    def notify_order(self, order):
+        self.track(order)
+        if self.params.journal is not None:
+            self.params.journal.order(order)
+        if self.bounded and not order.alive():
+            self.bounded.forget(self.broker, order)
+
+    def notify_trade(self, trade):
+        if self.params.journal is not None and trade.isclosed:
+            self.params.journal.trade(trade)
+        if self.bounded and trade.isclosed:
+            self.bounded.closed(self, trade)
+
+    def track(self, order):
+        if order is None: return order
+
+        if order.alive():
+            self.pending[order.data][order.ref] = order
+        else:
+            self.pending[order.data].pop(order.ref, None)
+        return order
+
+    def hasorder(self, data):
+        return bool(self.pending.get(data))
+
+    def snapshot(self):
+        '''
+        State to pick this run up from with ``resume``, made only of lists,
+        dicts and numbers so it can be written as JSON.
+        '''
+        datas = {}
+        for data in self.datas:
+            position = self.broker.getposition(data)
+            trades = self._trades[data][0]
+            trade = trades[-1] if trades and trades[-1].isopen else None
+            orders = sorted(self.pending[data].values(), key=lambda order: order.ref)
+            count = min(len(data), self.lookback)
+            datas[dataname(data)] = dict(
+                position=[position.size, position.price],
+                trade=None if trade is None else dict(
+                    size=trade.size, price=trade.price, value=trade.value, commission=trade.commission,
+                    pnl=trade.pnl, pnlcomm=trade.pnlcomm, dtopen=trade.dtopen),
+                orders=[dict(ref=order.ref, buy=order.isbuy(), size=abs(order.created.size),
+                             price=order.created.price, exectype=order.exectype) for order in orders],
+                bars=dict((name, list(getattr(data.lines, name).get(size=count)))
+                          for name in data.lines.getlinealiases()))
+        return dict(cash=self.broker.getcash(), datas=datas)
+
+    def restore(self, state):
+        '''Puts the cash, positions and open trades of ``state`` back.'''
+        self.broker.setcash(state['cash'])
+        for data in self.datas:
+            saved = state['datas'].get(dataname(data))
+            if saved is None: continue
+
+            size, price = saved['position']
+            if size:
+                self.broker.positions[data] = bt.Position(size, price)
+            if saved['trade'] is not None:
+                trade = saved['trade']
+                restored = bt.Trade(data=data, size=trade['size'], price=trade['price'],
+                                    value=trade['value'], commission=trade['commission'])
+                restored.pnl, restored.pnlcomm, restored.dtopen = trade['pnl'], trade['pnlcomm'], trade['dtopen']
+                restored.isopen, restored.status = True, restored.Open
+                self._trades[data][0].append(restored)
+
+    def reorder(self):
+        '''
+        Places the orders of ``resume`` again, those of all datas in the
+        order they were made.
+        '''
+        orders = []
+        for data in self.datas:
+            saved = self.params.resume['datas'].get(dataname(data))
+            orders.extend((order, data) for order in (saved['orders'] if saved is not None else ()))
+        # snapshots from before refs were saved keep the order of the datas
+        for order, data in sorted(orders, key=lambda item: item[0].get('ref', 0)):
+            place = self.buy if order['buy'] else self.sell
+            place(data=data, size=order['size'], price=order['price'], exectype=order['exectype'])
+
+    def support_resistance(self, h):
+        '''``tl.calc_support_resistance``, through ``fitcache`` if set.'''
+        if self.params.fitcache is None:
+            return tl.calc_support_resistance(h)
+        return self.params.fitcache.calc_support_resistance(h)
+
+    def start(self):
+        if self.params.resume is not None:
+            self.restore(self.params.resume)
+
+    def stop(self):
+        if self.params.journal is not None:
+            self.params.journal.flush()
+        if self.params.fitcache is not None:
+            self.params.fitcache.flush()
+            print(self.params.fitcache.report())
+        if self.live:
+            print(self.latency.report())
+        if self.params.profile:
+            print(self.profiler.report())
+            if self.params.profileout:
+                self.profiler.export(self.params.profileout)
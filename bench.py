@@ -0,0 +1,181 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+import trendln as tl
+import backtrader as bt
+
+import main
+import new_try
+from columnar import read_csv
+from fastcsv import FastBacktraderCSVData
+
+RAW = ['data.csv', 'data1.csv', 'data2.csv']
+WINDOWS = [30, 60, 120]
+
+
+def best(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def preload(datas):
+    for data in datas:
+        bt.Cerebro().adddata(data)
+        data._start()
+        data.preload()
+    return datas
+
+
+def filenames(tickers):
+    return ['{0}.csv'.format(ticker) for ticker in tickers]
+
+
+def backtest(module, tickers):
+    '''Runs the strategy of ``module`` quietly, returns (seconds, bars).'''
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(100000)
+    cerebro.addstrategy(module.Strategy, printlog=False)
+    datas = module.parse_data(filenames(tickers))
+    for data in datas:
+        cerebro.adddata(data)
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        cerebro.run()
+    return time.time() - start, sum(data.buflen() for data in datas)
+
+
+def maxrss():
+    '''Peak resident set size of this process so far, in bytes.'''
+    # kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def _peakrss(tickers, queue):
+    backtest(main, tickers)
+    queue.put(maxrss())
+
+
+def peakrss(tickers):
+    # a fresh interpreter so nothing measured before counts
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_peakrss, args=(tickers, queue))
+    process.start()
+    rss = queue.get()
+    process.join()
+    return rss
+
+
+def run(tickers=main.TICKERS, repeat=3, runs=1, samples=50):
+    '''
+    Runs every benchmark, returns ``{name: {value, unit, better}}`` where
+    ``better`` tells whether ``lower`` or ``higher`` values are better.
+    '''
+    results = {}
+
+    def record(name, value, unit, better='lower'):
+        results[name] = dict(value=value, unit=unit, better=better)
+        print('{0:<32} {1:>12.4f} {2}'.format(name, value, unit))
+
+    record('load.parse_data', best(lambda: preload(main.parse_data(filenames(tickers))), repeat), 's')
+    record('load.read_csv', best(lambda: [read_csv(path) for path in RAW], repeat), 's')
+    record('load.min_data', best(lambda: preload([FastBacktraderCSVData(dataname='min_data.txt')]), repeat), 's')
+
+    for module in (main, new_try):
+        seconds, bars = min(backtest(module, tickers) for _ in range(runs))
+        record('next.{0}'.format(module.__name__), bars / seconds, 'bars/s', 'higher')
+
+    closes = read_csv('AAPL.csv')[1]['close']
+    for window in WINDOWS:
+        series = [closes[i:i + window] for i in range(0, len(closes) - window, max(1, (len(closes) - window) // samples))]
+        seconds = best(lambda: [tl.calc_support_resistance(h) for h in series], repeat)
+        record('calc_support_resistance.{0}'.format(window), 1000.0 * seconds / len(series), 'ms/call')
+
+    record('memory.peak_rss', peakrss(tickers) / 2.0 ** 20, 'MB')
+    return results
+
+
+def save(path, results):
+    meta = dict(time=time.strftime('%Y-%m-%d %H:%M:%S'),
+                python=platform.python_version(),
+                platform=platform.platform(),
+                backtrader=bt.__version__,
+                numpy=np.__version__)
+    with open(path, 'w') as f:
+        json.dump(dict(meta=meta, results=results), f, indent=2, sort_keys=True)
+
+
+def compare(old, new, tolerance=0.1):
+    '''
+    Prints every benchmark of the ``old`` and ``new`` result files side by
+    side and returns the names which got worse by more than ``tolerance``.
+    '''
+    with open(old) as f:
+        old = json.load(f)['results']
+    with open(new) as f:
+        new = json.load(f)['results']
+
+    regressions = []
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name]['value'], new[name]['value']
+        change = (after - before) / before if before else 0.0
+        worse = change > tolerance if new[name]['better'] == 'lower' else change < -tolerance
+        if worse:
+            regressions.append(name)
+        print('{0:<32} {1:>12.4f} {2:>12.4f} {3:>+8.1%} {4}{5}'.format(
+            name, before, after, change, new[name]['unit'], '  REGRESSION' if worse else ''))
+    for name in sorted(set(old) ^ set(new)):
+        print('{0:<32} only in {1}'.format(name, 'old' if name in old else 'new'))
+    return regressions
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Benchmarks over the checked-in data')
+
+    parser.add_argument('--output', default='bench.json',
+                        help='JSON file the results are written to')
+
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), default=None,
+                        help='Compare two result files instead of running')
+
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative change counted as a regression')
+
+    parser.add_argument('--tickers', nargs='+', default=main.TICKERS,
+                        help='Tickers the loading and backtests run over')
+
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs of the loading and fitting benchmarks, the best one counts')
+
+    parser.add_argument('--runs', type=int, default=1,
+                        help='Runs of the backtests, the best one counts')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.tolerance) else 0)
+    save(args.output, run(args.tickers, repeat=args.repeat, runs=args.runs))
@@ -0,0 +1,117 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import backtrader as bt
+
+import main
+from columnar import COLUMNS, ArrayData, num2timestamps, read_csv
+
+
+def histories(tickers):
+    '''``{ticker: (timestamps, columns, days)}`` of the ``<ticker>.csv`` bars.'''
+    bars = {}
+    for ticker in tickers:
+        timestamps, columns = read_csv('{0}.csv'.format(ticker))
+        days = timestamps.astype('datetime64[s]').astype('datetime64[D]').astype(str)
+        bars[ticker] = timestamps, columns, days
+    return bars
+
+
+def load(path):
+    if not os.path.exists(path): return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path, state):
+    # a run killed while writing leaves the previous snapshot in place
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def chunk(state, ticker, timestamps, columns, rows):
+    '''The bars of ``ticker`` carried over by ``state`` followed by ``rows``.'''
+    saved = state['datas'].get(ticker) if state is not None else None
+    if saved is None:
+        return timestamps[rows], dict((name, columns[name][rows]) for name in COLUMNS)
+    carried = saved['bars']
+    return (np.concatenate((num2timestamps(carried['datetime']), timestamps[rows])),
+            dict((name, np.concatenate((carried[name], columns[name][rows]))) for name in COLUMNS))
+
+
+def run_day(bars, day, state=None, **kwargs):
+    '''
+    Backtests ``main.Strategy`` over the bars of ``day`` resuming from
+    ``state`` (``None`` to start afresh) and returns the strategy and the
+    snapshot it ended in.
+    '''
+    cerebro = bt.Cerebro()
+    cerebro.broker.setcash(100000)
+    cerebro.addstrategy(main.Strategy, resume=state, **kwargs)
+    for ticker, (timestamps, columns, days) in bars.items():
+        timestamps, columns = chunk(state, ticker, timestamps, columns, days == day)
+        cerebro.adddata(ArrayData(timestamps=timestamps, columns=columns), name=ticker)
+    strategy = cerebro.run()[0]
+
+    snapshot = strategy.snapshot()
+    snapshot['day'] = day
+    return strategy, snapshot
+
+
+def run(tickers, path='checkpoint.json', days=None, restart=False, **kwargs):
+    '''
+    Backtests the days of ``tickers`` not covered by the snapshot at
+    ``path`` yet (at most ``days`` of them), one run per day, each resuming
+    from the snapshot of the one before, which is then replaced. Returns the
+    last snapshot.
+    '''
+    state = None if restart else load(path)
+    bars = histories(tickers)
+    todo = np.unique(np.concatenate([days for _, _, days in bars.values()]))
+    if state is not None:
+        todo = todo[todo > state['day']]
+    for day in todo[:days]:
+        start = time.time()
+        strategy, state = run_day(bars, str(day), state, **kwargs)
+        save(path, state)
+        print('{0}: value {1:.2f}, {2} bars in {3:.1f}s'.format(
+            day, strategy.broker.getvalue(), len(strategy), time.time() - start))
+    return state
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Backtest main.Strategy a day at a time, resuming from a snapshot')
+
+    parser.add_argument('--tickers', nargs='+', default=['AAPL', 'TSLA', 'KO'],
+                        help='Tickers whose <ticker>.csv is backtested')
+
+    parser.add_argument('--state', default='checkpoint.json',
+                        help='Snapshot resumed from and rewritten after every day')
+
+    parser.add_argument('--days', type=int, default=None,
+                        help='Days backtested at most, all the new ones if not given')
+
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore the snapshot and start from the first day')
+
+    parser.add_argument('--printlog', action='store_true',
+                        help='Print the trades as they happen')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    run(args.tickers, path=args.state, days=args.days, restart=args.restart, printlog=args.printlog)
@@ -21,36 +21,59 @@
 from __future__ import (absolute_import, division, print_function,)
 #                        unicode_literals)
 
-import trendln as tl
 import backtrader as bt
 
-class St(bt.Strategy):
+from basestrategy import BaseStrategy
+from fastcsv import FastBacktraderCSVData
+from fitcache import FitCache
+from journal import ConsoleSink, Journal
+from lookback import LookbackWindow
+from trendlines import RollingSupportResistance
+
+class St(BaseStrategy):
     params = (
         ('timeframe', 60),
-        ('printlog', True)
+        ('rolling', True),
+        ('checkfits', False),
+        ('lazy', True)
     )
 
-    def log(self, data, txt, doprint=False):
-        if self.params.printlog or doprint:
-            datetime = data.datetime
-            date = datetime.date(0)
-            time = datetime.time(0)
-            print('%s, %s, %s' % (date, time, txt))
+    def __init__(self):
+        super(St, self).__init__()
+        self.fits = [RollingSupportResistance(self.params.timeframe, check=self.params.checkfits,
+                                              cache=self.params.fitcache) for _ in self.datas]
+        self.windows = [LookbackWindow(data, self.params.timeframe + 1, lines=('close',)) for data in self.datas]
+        self.lookback = self.params.timeframe + 1
 
     def next(self):
         if len(self) < self.params.timeframe: return
 
         for dataindex, data in enumerate(self.datas):
-            hasOrder = False
-            for order in self.broker.get_orders_open():
-                if order.data == data: hasOrder = True
-            if hasOrder: continue
-
-            dataArray = []
-            for i in range(-self.params.timeframe, 0):
-                dataArray.append(data.close[i])
-
-            (_, pmin, mintrend, _), (_, pmax, maxtrend, _) = tl.calc_support_resistance(dataArray)
+            if self.hasorder(data):
+                self.profiler.count('pending', dataindex)
+                continue
+
+            with self.profile('windows', dataindex):
+                dataArray = self.windows[dataindex].update().get('close', ago=-1)
+
+            with self.profile('fit', dataindex):
+                if self.params.rolling and self.params.lazy:
+                    # flat any support line ends the loop below and holding
+                    # any resistance line does, so that side goes first and
+                    # the other one is only fitted when it came out empty
+                    fits = self.fits[dataindex].advance(dataArray, len(data))
+                    if self.getposition(data=data, broker=self.broker):
+                        pmax, maxtrend = fits.resistance()
+                        if maxtrend: break
+                        pmin, mintrend = fits.support()
+                    else:
+                        pmin, mintrend = fits.support()
+                        if mintrend: break
+                        pmax, maxtrend = fits.resistance()
+                elif self.params.rolling:
+                    pmin, mintrend, pmax, maxtrend = self.fits[dataindex].update(dataArray, len(data))
+                else:
+                    (_, pmin, mintrend, _), (_, pmax, maxtrend, _) = self.support_resistance(dataArray)
 
             if maxtrend or mintrend:
                 position = self.getposition(data=data, broker=self.broker)
@@ -84,30 +107,37 @@ class St(bt.Strategy):
                 if shouldBuy and shouldSell: break
 
                 if shouldSell:
-                    self.sell(data=data, size=position.size)
+                    with self.profile('order', dataindex):
+                        self.sell(data=data, size=position.size)
                     self.log(data, 'Sold data #{0} for {1}'.format(dataindex, data.close[0]))
                 elif shouldBuy:
-                    self.buy(data=data, size=1)
+                    with self.profile('order', dataindex):
+                        self.buy(data=data, size=1)
                     self.log(data, 'Bought data #{0} for {1}'.format(dataindex, data.close[0]))
 
     def notify_trade(self, trade):
+        super(St, self).notify_trade(trade)
         if not trade.isclosed: return
         self.log(trade.data, 'OPERATION PROFIT, GROSS %.2f, NET %.2f' % (trade.pnl, trade.pnlcomm))
 
     def start(self):
+        super(St, self).start()
         print('Start cash: %.2f' % (self.broker.getvalue()))
 
     def stop(self):
         print('End cash: %.2f' % (self.broker.getvalue()))
+        super(St, self).stop()
 
 if __name__ == '__main__':
 
-    data = bt.feeds.BacktraderCSVData(dataname='min_data.txt',timeframe=bt.TimeFrame.Minutes)
+    data = FastBacktraderCSVData(dataname='min_data.txt',timeframe=bt.TimeFrame.Minutes)
 
     cerebro = bt.Cerebro()
     cerebro.adddata(data)
-    cerebro.addstrategy(St)
+    journal = Journal('close-minute-journal.csv', console=ConsoleSink())
+    cerebro.addstrategy(St, fitcache=FitCache('fits.sqlite'), journal=journal)
 
     cerebro.broker.setcash(10000.0)
 
-    cerebro.run()
\ No newline at end of file
+    cerebro.run()
+    journal.close()
\ No newline at end of file
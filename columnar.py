@@ -0,0 +1,241 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import math
+import os
+
+import numpy as np
+
+import backtrader as bt
+
+# One <column>.npy per column in a directory per ticker. Timestamps are int64
+# seconds since the epoch of the naive exchange time, the rest float64.
+TIMESTAMP = 'timestamp'
+COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'openinterest')
+
+# datetime.date(1970, 1, 1).toordinal()
+EPOCH_ORDINAL = 719163
+
+
+def write_bars(directory, timestamps, columns):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    np.save(os.path.join(directory, TIMESTAMP + '.npy'), np.asarray(timestamps, dtype=np.int64))
+    for name in COLUMNS:
+        np.save(os.path.join(directory, name + '.npy'), np.asarray(columns[name], dtype=np.float64))
+
+
+def read_bars(directory, mmap_mode='r'):
+    timestamps = np.load(os.path.join(directory, TIMESTAMP + '.npy'), mmap_mode=mmap_mode)
+    columns = dict((name, np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode))
+                   for name in COLUMNS)
+    return timestamps, columns
+
+
+def read_csv(path):
+    '''
+    Reads any of the bar layouts in this repo with the C parser: the
+    headerless files written by download_data, raw yfinance downloads
+    (``Datetime,Open,...`` with a UTC offset) and ``Date,Time,...`` files
+    for BacktraderCSVData such as min_data.txt.
+    '''
+    import pandas as pd  # here so reading the store never loads it
+
+    with open(path) as f:
+        header = f.readline()
+
+    if header.startswith('Date,Time,'):
+        frame = pd.read_csv(path, float_precision='round_trip')
+        stamps = frame['Date'] + ' ' + frame['Time']
+        oi = frame['OpenInterest']
+    else:
+        if header.startswith('Date') or header.startswith('Datetime'):
+            frame = pd.read_csv(path, float_precision='round_trip')
+            frame.insert(0, 'Index', range(len(frame)))
+        else:
+            frame = pd.read_csv(path, header=None, float_precision='round_trip')
+        frame.columns = ['Index', 'Datetime', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+        stamps = frame['Datetime'].astype(str).str[0:19]
+        oi = np.zeros(len(frame))
+
+    stamps = pd.to_datetime(stamps, format='%Y-%m-%d %H:%M:%S')
+    timestamps = (stamps.values.astype('datetime64[s]') - np.datetime64(0, 's')).astype(np.int64)
+    columns = dict(open=frame['Open'], high=frame['High'], low=frame['Low'], close=frame['Close'],
+                   volume=frame['Volume'], openinterest=oi)
+    return timestamps, dict((name, np.asarray(values, dtype=np.float64)) for name, values in columns.items())
+
+
+def convert(path, root):
+    '''Converts a bar CSV into ``root/<file name without extension>``.'''
+    directory = os.path.join(root, os.path.splitext(os.path.basename(path))[0])
+    timestamps, columns = read_csv(path)
+    write_bars(directory, timestamps, columns)
+    return directory
+
+
+def prepare(filenames, root='bars'):
+    '''
+    Converts every bar file into the columnar store under ``root`` unless
+    it is there and newer already. Returns the store directories.
+    '''
+    stores = []
+    for filename in filenames:
+        store = os.path.join(root, os.path.splitext(os.path.basename(filename))[0])
+        stamp = os.path.join(store, TIMESTAMP + '.npy')
+        if not os.path.exists(stamp) or os.path.getmtime(stamp) < os.path.getmtime(filename):
+            convert(filename, root)
+        stores.append(store)
+    return stores
+
+
+def date2num(timestamps):
+    '''
+    Vectorized ``bt.date2num`` giving the very same floats, so bars line up
+    with the ones of any other feed. ``date2num`` is the correctly rounded
+    sum of the day ordinal and the time of day fractions; for an integer
+    ordinal that is the ordinal plus the time of day rounded to the ulp of
+    the ordinal, which only depends on the time of day and the exponent.
+    '''
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    days, seconds = np.divmod(timestamps, 86400)
+    ordinals = (days + EPOCH_ORDINAL).astype(np.float64)
+    exponents = np.frexp(ordinals)[1]
+
+    keys, first, inverse = np.unique(seconds * 64 + exponents, return_index=True, return_inverse=True)
+    offsets = np.empty(len(keys))
+    for k, i in enumerate(first):
+        base, second = float(ordinals[i]), int(seconds[i])
+        hour, minute, second = second // 3600, second // 60 % 60, second % 60
+        offsets[k] = math.fsum((base, hour / 24.0, minute / 1440.0, second / 86400.0, 0.0)) - base
+    return ordinals + offsets[inverse.reshape(-1)]
+
+
+def num2timestamps(dtnums):
+    '''Inverse of ``date2num`` for bars on whole seconds.'''
+    days = np.asarray(dtnums, dtype=np.float64) - EPOCH_ORDINAL
+    return np.rint(days * 86400).astype(np.int64)
+
+
+def arrayloading(feed):
+    '''
+    Subclass of the data feed class ``feed`` which can hand its whole history
+    over as arrays: ``loadarrays`` returns the ``date2num`` datetimes and a
+    dict of line name to array, or ``None`` to fall back to the loading of
+    ``feed``. Lines without a column are left NaN. When preloaded without
+    filters the arrays are copied into the lines in bulk.
+
+    ``loadchunks`` may instead return an iterator over pieces of the history
+    in the same form, which are then read one after the other as the bars
+    are loaded, so the whole file never has to be in memory.
+
+    A plain mixin does not work here, the backtrader metaclass would add the
+    lines of ``feed`` a second time.
+    '''
+
+    class ArrayLoader(feed):
+
+        def start(self):
+            super(ArrayLoader, self).start()
+            self.chunks = self.loadchunks()
+            if self.chunks is None:
+                self.arrays = self.loadarrays()
+            else:
+                self.arrays = next(self.chunks, (np.empty(0), {}))
+            self.row = 0
+
+        def stop(self):
+            super(ArrayLoader, self).stop()
+            self.arrays = self.chunks = None
+
+        def loadarrays(self):
+            return None
+
+        def loadchunks(self):
+            return None
+
+        def preload(self):
+            if self.arrays is None or self.chunks is not None or self._filters or self._tzinput:
+                return super(ArrayLoader, self).preload()
+
+            dtnums, columns = self.arrays
+            rows = (dtnums >= self.fromdate) & (dtnums <= self.todate)
+            for name in self.lines.getlinealiases():
+                if name == 'datetime':
+                    values = dtnums[rows]
+                elif columns.get(name) is not None:
+                    values = np.ascontiguousarray(columns[name][rows], dtype=np.float64)
+                else:
+                    values = np.full(np.count_nonzero(rows), np.nan)
+                getattr(self.lines, name).array.frombytes(values.tobytes())
+            self.row = len(dtnums)
+            self.home()
+
+        def _load(self):
+            if self.arrays is None:
+                return super(ArrayLoader, self)._load()
+
+            dtnums, columns = self.arrays
+            row = self.row
+            if row >= len(dtnums):
+                chunk = next(self.chunks, None) if self.chunks is not None else None
+                if chunk is None:
+                    return False
+                self.arrays, self.row = chunk, 0
+                return self._load()
+            self.lines.datetime[0] = dtnums[row]
+            for name, values in columns.items():
+                if values is not None:
+                    getattr(self.lines, name)[0] = values[row]
+            self.row = row + 1
+            return True
+
+    ArrayLoader.__name__ = ArrayLoader.__qualname__ = str('ArrayLoader_' + feed.__name__)
+    return ArrayLoader
+
+
+class ArrayData(arrayloading(bt.feed.DataBase)):
+    '''
+    Data feed over whole-history arrays: ``timestamps`` as accepted by
+    ``date2num`` and ``columns``, a dict of line name to array.
+    '''
+    params = (
+        ('timeframe', bt.TimeFrame.Minutes),
+        ('timestamps', None),
+        ('columns', None),
+    )
+
+    def loadarrays(self):
+        return date2num(self.p.timestamps), self.p.columns
+
+
+class ColumnarData(ArrayData):
+    '''
+    Data feed over a directory written by ``write_bars``/``convert``. The
+    columns are memory-mapped rather than read.
+    '''
+
+    def loadarrays(self):
+        timestamps, columns = read_bars(self.p.dataname)
+        return date2num(timestamps), columns
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Convert bar CSVs into the columnar store')
+
+    parser.add_argument('files', nargs='+', help='CSV files to convert')
+
+    parser.add_argument('--output', default='bars',
+                        help='Directory holding one store per file')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for path in args.files:
+        print('{0} -> {1}'.format(path, convert(path, args.output)))
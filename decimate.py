@@ -0,0 +1,105 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import contextlib
+import datetime
+import io
+import time
+
+import backtrader as bt
+
+import main
+import new_try
+
+STRATEGIES = dict(main=main, new_try=new_try)
+
+
+def timers(every=None, at=(), weekdays=()):
+    '''
+    ``add_timer`` kwargs for a timer going off every ``every`` minutes from
+    the session start and one at each ``datetime.time`` of ``at``.
+    '''
+    timers = []
+    if every:
+        timers.append(dict(when=bt.timer.SESSION_START, repeat=datetime.timedelta(minutes=every),
+                           weekdays=list(weekdays)))
+    for when in at:
+        timers.append(dict(when=when, weekdays=list(weekdays)))
+    return timers
+
+
+def backtest(module, tickers, cash=100000.0, **kwargs):
+    '''Runs the strategy of ``module`` quietly, returns it and the seconds taken.'''
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(cash)
+    cerebro.addstrategy(module.Strategy, printlog=False, precompute=False, **kwargs)
+    for data in module.parse_data(['{0}.csv'.format(ticker) for ticker in tickers]):
+        cerebro.adddata(data)
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+    return strategy, time.time() - start
+
+
+def compare(module, tickers, timers, cash=100000.0, **kwargs):
+    '''
+    Backtests the strategy of ``module`` running its signals on every bar
+    and only on ``timers``, prints both and what the timers saved and cost.
+    Signals are computed in ``next`` in both runs, as precomputing them
+    fits every bar regardless.
+    '''
+    rows = []
+    for name, runtimers in (('every bar', None), ('timers', timers)):
+        strategy, seconds = backtest(module, tickers, cash=cash, timers=runtimers, **kwargs)
+        rows.append((name, strategy.evaluations, seconds, strategy.broker.getvalue() - cash,
+                     strategy.wins + strategy.loses))
+
+    print('{0:<10} {1:>11} {2:>9} {3:>10} {4:>7}'.format('', 'evaluations', 'seconds', 'pnl', 'trades'))
+    for row in rows:
+        print('{0:<10} {1:>11} {2:>9.2f} {3:>10.2f} {4:>7}'.format(*row))
+
+    (_, full, fullseconds, fullpnl, _), (_, timed, timedseconds, timedpnl, _) = rows
+    print('{0:.1%} fewer evaluations, {1:.1f}x faster, pnl {2:+.2f}'.format(
+        1 - timed / full if full else 0.0, fullseconds / timedseconds, timedpnl - fullpnl))
+    return rows
+
+
+def parse_time(text):
+    return datetime.datetime.strptime(text, '%H:%M').time()
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Compare a strategy running its signals on every bar and on timers only')
+
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='main',
+                        help='Module of the strategy')
+
+    parser.add_argument('--tickers', nargs='+', default=['AAPL', 'TSLA', 'KO'],
+                        help='Tickers whose <ticker>.csv is backtested')
+
+    parser.add_argument('--every', type=int, default=5,
+                        help='Run the signals every this many minutes, 0 for never')
+
+    parser.add_argument('--at', nargs='*', type=parse_time, default=[],
+                        metavar='HH:MM', help='Also run them at these times, '
+                        'e.g. 09:31 for the open or 15:55 before the close')
+
+    parser.add_argument('--weekdays', nargs='*', type=int, default=[],
+                        help='ISO weekdays the timers go off on, all if not given')
+
+    parser.add_argument('--strat', required=False, default='',
+                        metavar='kwargs', help='kwargs in key=value format')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    compare(STRATEGIES[args.strategy], args.tickers, timers(args.every, args.at, args.weekdays),
+            **eval('dict(' + args.strat + ')'))
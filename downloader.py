@@ -0,0 +1,187 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Layout written by download_data and read back by parse_data: a row number
+# followed by these columns, no header
+COLUMNS = ['Datetime', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+def normalize(frame):
+    '''
+    Turns a provider frame indexed by timestamp into store columns with the
+    timestamp as naive exchange time truncated to seconds.
+    '''
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame = frame.droplevel(1, axis=1)
+    frame = frame.reset_index()
+    frame = frame.rename(columns={frame.columns[0]: 'Datetime'})
+    frame['Datetime'] = frame['Datetime'].astype(str).str[0:19]
+    return frame[COLUMNS]
+
+
+def complete(frame):
+    # a download made during the session ends with a partial bar stamped
+    # mid-minute, which the next download replaces with the full minute
+    return frame[frame['Datetime'].str[17:19] == '00']
+
+
+class YahooProvider(object):
+    '''
+    Minute bars from Yahoo Finance, what download_data always used.
+
+    Yahoo only keeps about the last 30 days of 1m bars and serves at most 7
+    days of them per request, so an incremental fetch starts no earlier
+    than ``history`` ago and asks for the gap in requests of ``chunk``. A
+    store last updated before that is left with a gap instead of no longer
+    updating.
+    '''
+
+    def __init__(self, period='7d', interval='1m',
+                 history=datetime.timedelta(days=29), chunk=datetime.timedelta(days=7)):
+        self.period = period
+        self.interval = interval
+        self.history = history
+        self.chunk = chunk
+
+    def fetch(self, ticker, start=None):
+        import yfinance as yf
+
+        if start is None:
+            frame = yf.download(tickers=ticker, period=self.period, interval=self.interval,
+                                auto_adjust=False, progress=False)
+            return normalize(frame)
+
+        today = datetime.date.today()
+        start = max(start.date(), today - self.history)
+        frames = []
+        while start <= today:
+            end = min(start + self.chunk, today + datetime.timedelta(days=1))
+            frames.append(normalize(yf.download(tickers=ticker, start=start.strftime('%Y-%m-%d'),
+                                                end=end.strftime('%Y-%m-%d'), interval=self.interval,
+                                                auto_adjust=False, progress=False)))
+            start = end
+        return pd.concat(frames, ignore_index=True)
+
+
+class CSVProvider(object):
+    '''
+    Serves ``<ticker>.csv`` files in the store layout from ``directory`` as
+    if they came from the network, up to ``until`` when set. Lets the
+    downloader run offline against the bundled data.
+    '''
+
+    def __init__(self, directory='.', until=None):
+        self.directory = directory
+        self.until = until
+        self.calls = []
+
+    def fetch(self, ticker, start=None):
+        self.calls.append((ticker, start))
+        frame = BarStore(self.directory).read(ticker)[COLUMNS].reset_index(drop=True)
+        if start is not None:
+            frame = frame[pd.to_datetime(frame['Datetime']) >= start]
+        if self.until is not None:
+            frame = frame[pd.to_datetime(frame['Datetime']) <= self.until]
+        return frame
+
+
+class BarStore(object):
+    '''
+    One CSV per ticker in ``directory``, in the layout parse_data reads.
+    New minutes are appended to the end of the file.
+    '''
+
+    def __init__(self, directory='.', pattern='{0}.csv'):
+        self.directory = directory
+        self.pattern = pattern
+
+    def path(self, ticker):
+        return os.path.join(self.directory, self.pattern.format(ticker))
+
+    def read(self, ticker):
+        return self.rows(ticker)[0]
+
+    def rows(self, ticker):
+        '''The stored bars of ``ticker`` and how many rows the file holds.'''
+        path = self.path(ticker)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return pd.DataFrame(columns=COLUMNS), 0
+        frame = pd.read_csv(path, header=None, index_col=0, names=['Index'] + COLUMNS, encoding='ascii')
+        # files written by a failed yfinance download only hold a header
+        valid = pd.to_datetime(frame['Datetime'], format='%Y-%m-%d %H:%M:%S', errors='coerce').notna()
+        return frame[valid], len(frame)
+
+    def last(self, ticker):
+        frame = complete(self.read(ticker))
+        if frame.empty: return None
+        return datetime.datetime.strptime(frame['Datetime'].iloc[-1], '%Y-%m-%d %H:%M:%S')
+
+    def append(self, ticker, frame):
+        path = self.path(ticker)
+        stored, rows = self.rows(ticker)
+        stored = complete(stored)
+        if not stored.empty:
+            frame = frame[frame['Datetime'] > stored['Datetime'].iloc[-1]]
+        frame = complete(frame).drop_duplicates('Datetime')
+        if frame.empty: return 0
+
+        if not stored.empty and len(stored) == rows:
+            frame = frame.set_axis(range(len(stored), len(stored) + len(frame)))
+            frame.to_csv(path, mode='a', sep=',', header=False, encoding='ascii')
+        else:
+            # nothing stored yet, or a partial bar or leftover header to drop
+            pd.concat([stored, frame], ignore_index=True).to_csv(path, sep=',', header=False, encoding='ascii')
+        return len(frame)
+
+
+class Downloader(object):
+    '''
+    Brings the store of every ticker up to date using a bounded pool of
+    threads. Each ticker only asks the provider for the minutes after its
+    last stored bar; failures are retried with exponential backoff and
+    leave the stored data untouched.
+    '''
+
+    def __init__(self, provider, store, workers=4, retries=3, backoff=1.0):
+        self.provider = provider
+        self.store = store
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+
+    def update(self, tickers):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.update_ticker, tickers))
+        filenames = []
+        for ticker, (added, error) in zip(tickers, results):
+            if error is not None:
+                print('Failed to download {0}: {1}'.format(ticker, error))
+            if self.store.last(ticker) is None:
+                print('No data for {0}'.format(ticker))
+            else:
+                filenames.append(self.store.path(ticker))
+        return filenames
+
+    def update_ticker(self, ticker):
+        last = self.store.last(ticker)
+        start = None if last is None else last + datetime.timedelta(minutes=1)
+
+        for attempt in range(self.retries + 1):
+            try:
+                frame = self.provider.fetch(ticker, start)
+            except Exception as e:
+                if attempt == self.retries: return 0, e
+                time.sleep(self.backoff * 2 ** attempt)
+            else:
+                return self.store.append(ticker, frame), None
@@ -0,0 +1,232 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import glob
+import time
+
+import numpy as np
+
+import backtrader as bt
+from backtrader.utils.py3 import integer_types, string_types
+
+from columnar import arrayloading, date2num
+
+
+def _read(path, headers, separator, usecols, strcols, chunksize=None):
+    # an iterator over frames of chunksize rows when given
+    import pandas as pd  # here so runs over other feeds never load it
+    try:
+        return pd.read_csv(path, sep=separator, header=None, skiprows=1 if headers else 0,
+                           usecols=usecols, dtype=dict((i, str) for i in strcols),
+                           keep_default_na=False, na_values=[''], float_precision='round_trip',
+                           chunksize=chunksize)
+    except pd.errors.EmptyDataError:
+        return None
+
+
+def _chunks(frames, toarrays):
+    for frame in frames:
+        arrays = toarrays(frame)
+        if arrays is None:
+            raise ValueError('sub-second timestamps cannot be read in chunks')
+        yield arrays
+
+
+def _timestamps(stamps, format):
+    import pandas as pd
+    stamps = pd.to_datetime(stamps, format=format).values
+    seconds = stamps.astype('datetime64[s]')
+    if (stamps != seconds).any():
+        return None  # date2num of sub-second times is left to the slow path
+    return (seconds - np.datetime64(0, 's')).astype(np.int64)
+
+
+class FastGenericCSVData(arrayloading(bt.feeds.GenericCSVData)):
+    '''
+    Drop-in ``GenericCSVData`` taking the same column mapping which parses
+    the whole file at once with the pandas C parser and converts all the
+    timestamps in one batch, instead of tokenizing and ``strptime``-ing it
+    line by line. With ``chunksize`` the file is parsed that many rows at a
+    time as the bars are loaded.
+
+    Daily and larger timeframes, callable or float ``dtformat`` and
+    file-like ``dataname`` go through the ``GenericCSVData`` code.
+    '''
+    params = (
+        ('chunksize', None),
+    )
+
+    def layout(self):
+        # (dtformat, line names, csv columns) or None for the slow path
+        p = self.p
+        if not isinstance(p.dataname, string_types) or p.timeframe >= bt.TimeFrame.Days:
+            return None
+        if isinstance(p.dtformat, string_types):
+            dtformat = p.dtformat + ('T' + p.tmformat if p.time >= 0 else '')
+        elif isinstance(p.dtformat, integer_types) and int(p.dtformat) == 1:
+            dtformat = None
+        else:
+            return None
+
+        names = [x for x in self.getlinealiases() if x != 'datetime']
+        usecols = sorted(set(self.strcols() + [getattr(p, x) for x in names if getattr(p, x) is not None and getattr(p, x) >= 0]))
+        return dtformat, names, usecols
+
+    def strcols(self):
+        return [self.p.datetime] + ([self.p.time] if self.p.time >= 0 else [])
+
+    def loadarrays(self):
+        layout = self.layout()
+        if layout is None: return None
+
+        dtformat, names, usecols = layout
+        frame = _read(self.p.dataname, self.p.headers, self.p.separator, usecols, self.strcols())
+        if frame is None:
+            return np.empty(0), dict((name, np.empty(0)) for name in names)
+        return self.toarrays(frame, dtformat, names)
+
+    def loadchunks(self):
+        layout = self.layout()
+        if not self.p.chunksize or layout is None: return None
+
+        dtformat, names, usecols = layout
+        frames = _read(self.p.dataname, self.p.headers, self.p.separator, usecols, self.strcols(), self.p.chunksize)
+        return _chunks(frames or [], lambda frame: self.toarrays(frame, dtformat, names))
+
+    def toarrays(self, frame, dtformat, names):
+        p = self.p
+        if dtformat is None:
+            timestamps = frame[p.datetime].astype(np.int64).values
+        else:
+            stamps = frame[p.datetime] + ('T' + frame[p.time] if p.time >= 0 else '')
+            timestamps = _timestamps(stamps, dtformat)
+            if timestamps is None: return None
+
+        columns = {}
+        for name in names:
+            csvidx = getattr(p, name)
+            if csvidx is None or csvidx < 0:
+                columns[name] = np.full(len(frame), float(p.nullvalue))
+            else:
+                columns[name] = frame[csvidx].astype(np.float64).fillna(float(p.nullvalue)).values
+        return date2num(timestamps), columns
+
+
+class FastBacktraderCSVData(arrayloading(bt.feeds.BacktraderCSVData)):
+    '''
+    Drop-in ``BacktraderCSVData`` for ``Date,Time,Open,High,Low,Close,
+    Volume,OpenInterest`` files (``Time`` optional, ``sessionend`` is used
+    then) parsed in one vectorized pass, or ``chunksize`` rows at a time.
+    '''
+    params = (
+        ('chunksize', None),
+    )
+
+    def loadarrays(self):
+        p = self.p
+        if not isinstance(p.dataname, string_types):
+            return None
+
+        frame = _read(p.dataname, p.headers, p.separator, None, [0, 1])
+        if frame is None:
+            return np.empty(0), {}
+        return self.toarrays(frame)
+
+    def loadchunks(self):
+        p = self.p
+        if not p.chunksize or not isinstance(p.dataname, string_types):
+            return None
+        return _chunks(_read(p.dataname, p.headers, p.separator, None, [0, 1], p.chunksize) or [], self.toarrays)
+
+    def toarrays(self, frame):
+        if len(frame.columns) == 8:
+            stamps = frame[0] + ' ' + frame[1]
+            values = frame.columns[2:]
+        else:
+            stamps = frame[0] + ' ' + self.p.sessionend.strftime('%H:%M:%S')
+            values = frame.columns[1:]
+        timestamps = _timestamps(stamps, '%Y-%m-%d %H:%M:%S')
+        if timestamps is None: return None
+
+        names = ('open', 'high', 'low', 'close', 'volume', 'openinterest')
+        columns = dict((name, frame[col].astype(np.float64).values) for name, col in zip(names, values))
+        return date2num(timestamps), columns
+
+
+def _load(cls, path, **kwargs):
+    data = cls(dataname=path, **kwargs)
+    bt.Cerebro().adddata(data)
+    data._start()
+    data.preload()
+    return data
+
+
+def benchmark(genericfiles, btfiles, repeat=3):
+    '''
+    Times loading ``genericfiles`` the way ``parse_data`` does and
+    ``btfiles`` the way ``close-minute.py`` does, with the stock feeds and
+    the fast ones, and checks both produce the same lines.
+    '''
+    generic = dict(dtformat='%Y-%m-%d %H:%M:%S', timeframe=bt.TimeFrame.Minutes,
+                   datetime=1, open=2, high=3, low=4, close=5, volume=7)
+    cases = [
+        ('GenericCSVData', genericfiles, bt.feeds.GenericCSVData, FastGenericCSVData, generic),
+        ('BacktraderCSVData', btfiles, bt.feeds.BacktraderCSVData, FastBacktraderCSVData,
+         dict(timeframe=bt.TimeFrame.Minutes)),
+    ]
+
+    results = []
+    for name, files, slow, fast, kwargs in cases:
+        if not files: continue
+        timings = {}
+        for cls in (slow, fast):
+            best = None
+            for _ in range(repeat):
+                start = time.time()
+                datas = [_load(cls, path, **kwargs) for path in files]
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[cls] = best, datas
+
+        bars = 0
+        for a, b in zip(timings[slow][1], timings[fast][1]):
+            for line in a.lines.getlinealiases():
+                x = np.array(getattr(a.lines, line).array)
+                y = np.array(getattr(b.lines, line).array)
+                if not np.array_equal(x, y, equal_nan=True):
+                    raise AssertionError('{0}: {1} differs for {2}'.format(name, line, a.p.dataname))
+            bars += a.buflen()
+
+        results.append((name, len(files), bars, timings[slow][0], timings[fast][0]))
+        print('{0}: {1} files, {2} bars, {3:.3f}s -> {4:.3f}s ({5:.1f}x)'.format(
+            name, len(files), bars, timings[slow][0], timings[fast][0],
+            timings[slow][0] / max(timings[fast][0], 1e-9)))
+    return results
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Benchmark the fast CSV feeds against the stock ones')
+
+    parser.add_argument('--generic', nargs='*', default=None,
+                        help='Files in the download_data layout (default: bundled ticker CSVs)')
+
+    parser.add_argument('--backtrader', nargs='*', default=['min_data.txt'],
+                        help='Files in the Date,Time,... layout')
+
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per loader, the best one counts')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    generic = args.generic
+    if generic is None:
+        generic = sorted(f for f in glob.glob('*.csv') if not f.startswith('data') and not f.startswith('AAPL_test'))
+    benchmark(generic, args.backtrader, repeat=args.repeat)
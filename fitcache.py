@@ -0,0 +1,155 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import collections
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+import numpy as np
+
+# Part of every key, bump it whenever the fitting code changes its results
+VERSION = 1
+
+_MISSING = object()
+
+
+class FitCache(object):
+    '''
+    Content addressed cache of trendline fits, keyed by a hash of the window
+    values and the fit parameters, so the same window is only fitted once
+    whichever strategy, run or sweep worker asks for it.
+
+    Lookups go to an in-memory LRU of ``size`` entries first, then to an
+    SQLite file at ``path`` (no disk tier when ``None``) which several
+    processes may share. Disk writes are batched every ``batch`` new fits
+    and on ``flush``; the file is kept under about ``disksize`` bytes by
+    evicting the least recently used fits.
+
+    Cached values are shared, callers must not modify them.
+    '''
+
+    def __init__(self, path=None, size=65536, disksize=256 * 2 ** 20, batch=1000):
+        self.path = path
+        self.size = size
+        self.disksize = disksize
+        self.batch = batch
+        self.memory = collections.OrderedDict()
+        self.writes = []
+        self.touches = []
+        self.hits = 0
+        self.diskhits = 0
+        self.misses = 0
+        self.db = None
+
+    @staticmethod
+    def key(h, *params):
+        '''Hash of the series ``h`` (a sequence or a tuple of them) and ``params``.'''
+        digest = hashlib.sha1(repr((VERSION,) + params).encode('utf-8'))
+        for series in (h if type(h) is tuple else (h,)):
+            values = np.asarray(series, dtype=np.float64)
+            digest.update(str(len(values)).encode('ascii'))
+            digest.update(values.tobytes())
+        return digest.digest()
+
+    def connect(self):
+        if self.db is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.db = sqlite3.connect(self.path, timeout=60)
+            self.db.execute('CREATE TABLE IF NOT EXISTS fits '
+                            '(key BLOB PRIMARY KEY, value BLOB, size INTEGER, atime REAL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS fits_atime ON fits (atime)')
+            self.db.commit()
+        return self.db
+
+    def get(self, key, default=None):
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return value
+
+        if self.path is not None:
+            row = self.connect().execute('SELECT value FROM fits WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                value = pickle.loads(row[0])
+                self.remember(key, value)
+                self.touches.append((time.time(), key))
+                self.hits += 1
+                self.diskhits += 1
+                return value
+
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.remember(key, value)
+        if self.path is not None:
+            self.writes.append((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            if len(self.writes) >= self.batch:
+                self.flush()
+
+    def remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def cached(self, key, fit):
+        '''The value cached under ``key``, calling ``fit()`` to compute it on a miss.'''
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = fit()
+            self.put(key, value)
+        return value
+
+    def calc_support_resistance(self, h, **kwargs):
+        '''Memoized ``tl.calc_support_resistance``.'''
+        import trendln as tl
+
+        key = self.key(h, 'calc_support_resistance', sorted(kwargs.items()))
+        return self.cached(key, lambda: tl.calc_support_resistance(h, **kwargs))
+
+    def flush(self):
+        if self.path is None or not (self.writes or self.touches):
+            return
+        db = self.connect()
+        now = time.time()
+        with db:
+            db.executemany('INSERT OR REPLACE INTO fits VALUES (?, ?, ?, ?)',
+                           [(key, value, len(key) + len(value), now) for key, value in self.writes])
+            db.executemany('UPDATE fits SET atime = ? WHERE key = ?', self.touches)
+        self.writes, self.touches = [], []
+        self.evict()
+
+    def evict(self):
+        db = self.connect()
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM fits').fetchone()[0]
+        if total <= self.disksize:
+            return
+        # down to 90% so eviction does not run again on the next flush
+        excess = total - int(self.disksize * 0.9)
+        keys = []
+        for key, size in db.execute('SELECT key, size FROM fits ORDER BY atime'):
+            if excess <= 0: break
+            keys.append((key,))
+            excess -= size
+        with db:
+            db.executemany('DELETE FROM fits WHERE key = ?', keys)
+
+    def close(self):
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def report(self):
+        total = self.hits + self.misses
+        return 'Fit cache: {0} hits ({1} from disk), {2} misses, {3:.1%} hit rate'.format(
+            self.hits, self.diskhits, self.misses, self.hits / total if total else 0.0)
@@ -0,0 +1,223 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import backtrader as bt
+
+from lookback import LookbackWindow
+from profiler import NullProfiler
+from trendlines import RollingSupportResistance
+
+
+class TrendlineSignal(bt.Indicator):
+    '''
+    Buy/sell signal of the trendline strategies for every bar of a feed.
+
+    In ``runonce`` mode the whole history is fitted in ``once`` over sliding
+    window views of the preloaded close/low/high arrays and scored in one
+    batch, so the strategy only reads ``buy[0]``/``sell[0]`` in ``next``.
+
+    ``scoring`` selects how the fits are turned into a signal:
+
+      - ``confidence``: ``buyConfidence``/``sellConfidence`` as computed by
+        ``main.Strategy.buy_sell_prediction``, close fit weighted by
+        ``closeweight``
+      - ``unanimous``: 1.0/0.0 flags as computed by
+        ``new_try.Strategy.sell_buy_prediction`` on the close fit
+
+    ``profiler`` times the fitting and scoring of ``once``.
+    '''
+    lines = ('buy', 'sell')
+    params = (
+        ('timeframe', 60),
+        ('scoring', 'confidence'),
+        ('closeweight', 0.5),
+        ('fitcache', None),
+        ('profiler', None),
+    )
+    plotinfo = dict(plot=False)
+
+    def __init__(self):
+        if self.p.scoring not in ('confidence', 'unanimous'):
+            raise ValueError('scoring must be confidence or unanimous')
+        self.addminperiod(self.p.timeframe)
+        self.closefit = RollingSupportResistance(self.p.timeframe - 1, cache=self.p.fitcache)
+        self.lhfit = RollingSupportResistance(self.p.timeframe - 1, cache=self.p.fitcache)
+        self.window = LookbackWindow(self.data, self.p.timeframe + 1)
+
+    def next(self):
+        window = self.window.update()
+        closes = window.get('close', ago=-2)
+        lows = window.get('low', ago=-2)
+        highs = window.get('high', ago=-2)
+
+        buy, sell = self.score(np.array([self.data.close[0]]),
+                               [self.closefit.update(closes, len(self.data))],
+                               [self.fitlh(lows, highs, len(self.data))])
+        self.lines.buy[0] = buy[0]
+        self.lines.sell[0] = sell[0]
+
+    def once(self, start, end):
+        if start >= end: return
+
+        closes = self.windows(self.data.close)
+        lows = self.windows(self.data.low)
+        highs = self.windows(self.data.high)
+
+        profiler = self.p.profiler or NullProfiler()
+        cfits, lhfits = [], []
+        with profiler.phase('precompute.fit'):
+            for i in range(start, end):
+                cfits.append(self.closefit.update(closes[i].tolist(), i))
+                lhfits.append(self.fitlh(lows[i].tolist(), highs[i].tolist(), i))
+
+        with profiler.phase('precompute.score'):
+            buy, sell = self.score(np.array(self.data.close.array[start:end]), cfits, lhfits)
+        buyarray, sellarray = self.lines.buy.array, self.lines.sell.array
+        for i in range(start, end):
+            buyarray[i] = buy[i - start]
+            sellarray[i] = sell[i - start]
+
+    def windows(self, line):
+        # Row i holds line[-timeframe:-1] as seen from bar i. The first bars
+        # wrap around like negative indexing into the line buffer does.
+        timeframe = self.p.timeframe
+        array = np.frombuffer(line.array)
+        padded = np.concatenate((np.take(array, range(-timeframe, 0), mode='wrap'), array))
+        return sliding_window_view(padded, timeframe - 1)
+
+    def fitlh(self, lows, highs, end):
+        if self.p.scoring != 'confidence': return None
+        return self.lhfit.update((lows, highs), end)
+
+    def score(self, prices, cfits, lhfits):
+        if self.p.scoring == 'unanimous':
+            return self.unanimous(prices, cfits)
+
+        cbuy, csell = self.confidence(prices, cfits)
+        lhbuy, lhsell = self.confidence(prices, lhfits)
+        return cbuy * self.p.closeweight + lhbuy, csell * self.p.closeweight + lhsell
+
+    def predictions(self, fits, pos):
+        return predictions([fit[pos] for fit in fits], self.p.timeframe)
+
+    def confidence(self, prices, fits):
+        return confidence(prices, fits, self.p.timeframe)
+
+    def unanimous(self, prices, fits):
+        return unanimous(prices, fits, self.p.timeframe)
+
+
+def predictions(trends, timeframe):
+    '''
+    Flattens the trendline lists ``trends`` into ``(i, price)`` with the
+    price each line of ``trends[i]`` predicts at ``timeframe``.
+    '''
+    rows, slopes, intercepts = [], [], []
+    for row, lines in enumerate(trends):
+        for trend in lines:
+            rows.append(row)
+            slopes.append(trend[1][0])
+            intercepts.append(trend[1][1])
+    rows = np.array(rows, dtype=int)
+    return rows, timeframe * np.array(slopes, dtype=float) + np.array(intercepts, dtype=float)
+
+
+def _score(prices, lines, trends, timeframe, beats):
+    rows, predicted = predictions(trends, timeframe)
+    score = np.bincount(rows, np.where(beats(prices[rows], predicted), 1.0, -0.5), minlength=len(prices)).astype(float)
+    lines = np.array(lines, dtype=float).reshape(-1, 2)
+    return score + np.where(beats(prices, timeframe * lines[:, 0] + lines[:, 1]), 0.25, -0.25)
+
+
+def buyconfidence(prices, pmax, maxtrends, timeframe):
+    '''
+    The buy half of ``confidence``, from the resistance side alone: the
+    overall lines ``pmax`` and trendlines ``maxtrends`` of every position
+    of ``prices``.
+    '''
+    return _score(prices, pmax, maxtrends, timeframe, np.greater)
+
+
+def sellconfidence(prices, pmin, mintrends, timeframe):
+    '''The sell half of ``confidence``, from the support side alone.'''
+    return _score(prices, pmin, mintrends, timeframe, np.less)
+
+
+def confidence(prices, fits, timeframe):
+    '''
+    ``main.Strategy.buy_sell_prediction`` of every ``(pmin, mintrend, pmax,
+    maxtrend)`` in ``fits`` against the price at the same position of
+    ``prices``, as ``(buy, sell)`` arrays. The fits may be of successive bars
+    of one feed or of the same bar of many.
+    '''
+    return (buyconfidence(prices, [fit[2] for fit in fits], [fit[3] for fit in fits], timeframe),
+            sellconfidence(prices, [fit[0] for fit in fits], [fit[1] for fit in fits], timeframe))
+
+
+def unanimous(prices, fits, timeframe):
+    '''``new_try.Strategy.sell_buy_prediction`` as 1.0/0.0 flags, like ``confidence``.'''
+    size = len(prices)
+    minrows, minpredicted = predictions([fit[1] for fit in fits], timeframe)
+    maxrows, _ = predictions([fit[3] for fit in fits], timeframe)
+    mins = np.bincount(minrows, minlength=size)
+    maxs = np.bincount(maxrows, minlength=size)
+    below = np.bincount(minrows, prices[minrows] < minpredicted, minlength=size)
+    # new_try scores the buy side against the support lines too
+    above = np.bincount(minrows, prices[minrows] > minpredicted, minlength=size)
+    sell = (mins > 0) & (below == mins)
+    buy = (maxs > 0) & (above == maxs)
+    return buy.astype(float), sell.astype(float)
+
+
+class HigherTimeframe(object):
+    '''
+    Support/resistance of the last ``size`` bars of ``data``, a feed added
+    with ``multitimeframe.resample``. Both sides of the close and low/high fits are fitted
+    when a bar of the feed closes and served from the cache until the next
+    one does, instead of being refitted on every bar of the feed it was
+    resampled from.
+
+    ``fits`` returns the closes the fits were made on followed by ``price``,
+    so the line values at index ``size`` are the ones to score ``price``
+    against, and the ``(pmin, mintrend, pmax, maxtrend)`` of the close and
+    of the low/high fit. ``None`` until the feed has ``size`` bars.
+    '''
+
+    def __init__(self, data, size, fitcache=None):
+        self.data = data
+        self.size = size
+        self.window = LookbackWindow(data, size)
+        self.closefit = RollingSupportResistance(size, cache=fitcache)
+        self.lhfit = RollingSupportResistance(size, cache=fitcache)
+        self.length = None
+        self.cached = None
+        self.refits = 0
+        self.served = 0
+
+    @property
+    def compression(self):
+        return self.data._compression // self.data.data._compression
+
+    def fits(self, price):
+        length = len(self.data)
+        if length < self.size: return None
+
+        if length != self.length:
+            window = self.window.update()
+            closes = window.get('close')
+            self.cached = (np.append(closes, 0.0),
+                           self.closefit.update(closes, length),
+                           self.lhfit.update((window.get('low'), window.get('high')), length))
+            self.length = length
+            self.refits += 1
+        else:
+            self.served += 1
+
+        closes, closefit, lhfit = self.cached
+        closes[-1] = price
+        return closes, closefit, lhfit
@@ -0,0 +1,209 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import csv
+import datetime
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import backtrader as bt
+
+TEXT = ('kind', 'data', 'status', 'text')
+NUMBERS = ('datetime', 'ref', 'price', 'size', 'value', 'comm', 'pnl', 'pnlcomm',
+           'open', 'high', 'low', 'close', 'volume')
+FIELDS = ('run', 'kind', 'datetime', 'data', 'ref', 'status', 'price', 'size', 'value', 'comm',
+          'pnl', 'pnlcomm', 'open', 'high', 'low', 'close', 'volume', 'text')
+
+
+def dataname(data):
+    return data._name or str(data._id)
+
+
+class ConsoleSink(object):
+    '''
+    Prints journal messages at no more than ``rate`` lines per second on
+    average (bursts of up to ``burst``), counting the ones it drops.
+    ``rate=None`` prints everything.
+    '''
+
+    def __init__(self, rate=20.0, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.last = time.time()
+        self.dropped = 0
+
+    def emit(self, dtnum, data, text):
+        if self.rate is not None:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                self.dropped += 1
+                return
+            self.tokens -= 1
+        dt = bt.num2date(dtnum)
+        print('%s, %s, %s' % (dt.date(), dt.time(), text))
+
+    def close(self):
+        if self.dropped:
+            print('... {0} log lines not shown'.format(self.dropped))
+            self.dropped = 0
+
+
+class Journal(object):
+    '''
+    Structured record of orders, fills, closed trades, bar snapshots and log
+    messages.
+
+    Rows go into preallocated columns of ``batch`` rows; every full batch is
+    handed to a background thread which appends it to ``path``, an SQLite
+    database for ``.db``/``.sqlite`` files and CSV otherwise. Messages are
+    also passed to ``console`` (a ``ConsoleSink``) when given and asked
+    for. ``flush`` waits until everything recorded is written.
+
+    Every row carries ``run``, by default the time the journal was opened,
+    so the runs appended to the same file can be told apart.
+    '''
+
+    def __init__(self, path, console=None, batch=4096, run=None):
+        self.path = path
+        self.run = run or datetime.datetime.now().isoformat(str(' '), str('seconds'))
+        self.console = console
+        self.batch = batch
+        self.queue = queue.Queue(maxsize=8)
+        self.error = None
+        self.allocate()
+        self.sqlite = os.path.splitext(path)[1] in ('.db', '.sqlite')
+        if not self.sqlite and os.path.exists(path) and os.path.getsize(path):
+            with open(path) as f:
+                if next(csv.reader(f)) != list(FIELDS):
+                    raise ValueError('{0} has other columns than {1}, journal to another file'.format(
+                        path, ', '.join(FIELDS)))
+        self.writer = threading.Thread(target=self.write, name='journal')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def allocate(self):
+        self.numbers = dict((name, np.full(self.batch, np.nan)) for name in NUMBERS)
+        self.text = dict((name, [''] * self.batch) for name in TEXT)
+        self.row = 0
+
+    def record(self, kind, dtnum, data='', **fields):
+        row = self.row
+        self.text['kind'][row] = kind
+        self.text['data'][row] = data
+        self.numbers['datetime'][row] = dtnum
+        for name, value in fields.items():
+            if name in self.text:
+                self.text[name][row] = value
+            else:
+                self.numbers[name][row] = value
+        self.row = row + 1
+        if self.row == self.batch:
+            self.dispatch()
+
+    def message(self, dtnum, data, text, echo=True):
+        self.record('log', dtnum, data, text=text)
+        if echo and self.console is not None:
+            self.console.emit(dtnum, data, text)
+
+    def order(self, order):
+        data = dataname(order.data)
+        dtnum = order.data.datetime[0]
+        self.record('order', dtnum, data, ref=order.ref, status=order.getstatusname(),
+                    price=order.created.price or np.nan, size=order.created.size)
+        if order.status in (order.Partial, order.Completed):
+            self.record('fill', dtnum, data, ref=order.ref, status=order.getstatusname(),
+                        price=order.executed.price, size=order.executed.size,
+                        value=order.executed.value, comm=order.executed.comm)
+
+    def trade(self, trade):
+        self.record('trade', trade.data.datetime[0], dataname(trade.data), ref=trade.ref,
+                    status=trade.status_names[trade.status], price=trade.price,
+                    value=trade.value, comm=trade.commission, pnl=trade.pnl, pnlcomm=trade.pnlcomm)
+
+    def bar(self, data):
+        self.record('bar', data.datetime[0], dataname(data), open=data.open[0], high=data.high[0],
+                    low=data.low[0], close=data.close[0], volume=data.volume[0])
+
+    def dispatch(self):
+        if self.row:
+            self.queue.put((self.row, self.numbers, self.text))
+            self.allocate()
+
+    def flush(self):
+        self.dispatch()
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+        if self.console is not None:
+            self.console.close()
+
+    def write(self):
+        sqlite = self.sqlite
+        if sqlite:
+            db = sqlite3.connect(self.path)
+            db.execute('CREATE TABLE IF NOT EXISTS journal ({0})'.format(', '.join(
+                '{0} {1}'.format(name, 'REAL' if name in NUMBERS and name != 'datetime' else 'TEXT')
+                for name in FIELDS)))
+            # tables of journals from before the run column
+            if 'run' not in [column[1] for column in db.execute('PRAGMA table_info(journal)')]:
+                db.execute('ALTER TABLE journal ADD COLUMN run TEXT')
+        else:
+            header = not os.path.exists(self.path) or not os.path.getsize(self.path)
+            f = open(self.path, 'a')
+            writer = csv.writer(f, lineterminator='\n')
+            if header:
+                writer.writerow(FIELDS)
+
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    break
+                if self.error is None:
+                    rows = self.rows(*batch)
+                    if sqlite:
+                        with db:
+                            db.executemany('INSERT INTO journal ({0}) VALUES ({1})'.format(
+                                ', '.join(FIELDS), ', '.join('?' * len(FIELDS))), rows)
+                    else:
+                        writer.writerows([['' if value is None else value for value in row] for row in rows])
+                        f.flush()
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+        if sqlite:
+            db.close()
+        else:
+            f.close()
+
+    def rows(self, count, numbers, text):
+        columns = []
+        for name in FIELDS:
+            if name == 'run':
+                columns.append([self.run] * count)
+            elif name == 'datetime':
+                columns.append([bt.num2date(dtnum).isoformat(str(' ')) if not math.isnan(dtnum) else None
+                                for dtnum in numbers[name][:count].tolist()])
+            elif name in text:
+                columns.append(text[name][:count])
+            else:
+                columns.append([None if math.isnan(value) else value for value in numbers[name][:count].tolist()])
+        return list(zip(*columns))
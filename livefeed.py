@@ -0,0 +1,210 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import datetime
+import os
+import queue
+import threading
+import time
+
+import backtrader as bt
+
+import main
+from columnar import read_csv
+from downloader import complete
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class ReplayClock(object):
+    '''
+    Maps bar timestamps to wall-clock time for replays, ``speed`` times
+    faster than real time (``None`` for no waiting at all). Sources sharing
+    a clock release the bars of the same minute together.
+    '''
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.origin = None
+        self.lock = threading.Lock()
+
+    def wait(self, timestamp, stopped):
+        if not self.speed: return
+        with self.lock:
+            if self.origin is None:
+                self.origin = (timestamp, time.time())
+        first, start = self.origin
+        delay = start + (timestamp - first) / self.speed - time.time()
+        if delay > 0:
+            stopped.wait(delay)
+
+
+class ReplaySource(object):
+    '''
+    Plays back a bar CSV in any layout ``columnar.read_csv`` knows, waiting
+    on ``clock`` before every bar. Yields ``(datetime, open, high, low,
+    close, volume)``.
+    '''
+
+    def __init__(self, path, clock=None, limit=None):
+        self.path = path
+        self.clock = clock or ReplayClock()
+        self.limit = limit
+        self.stopped = threading.Event()
+
+    def __iter__(self):
+        timestamps, columns = read_csv(self.path)
+        count = len(timestamps) if self.limit is None else min(self.limit, len(timestamps))
+        for i in range(count):
+            timestamp = int(timestamps[i])
+            self.clock.wait(timestamp, self.stopped)
+            if self.stopped.is_set(): return
+            yield (EPOCH + datetime.timedelta(seconds=timestamp),
+                   float(columns['open'][i]), float(columns['high'][i]), float(columns['low'][i]),
+                   float(columns['close'][i]), float(columns['volume'][i]))
+
+    def close(self):
+        self.stopped.set()
+
+
+class PollingSource(object):
+    '''
+    Asks a ``downloader`` provider for the bars of ``ticker`` every
+    ``interval`` seconds and yields the complete minutes it has not yielded
+    yet.
+    '''
+
+    def __init__(self, provider, ticker, interval=60.0):
+        self.provider = provider
+        self.ticker = ticker
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def __iter__(self):
+        last = None
+        while not self.stopped.is_set():
+            start = None if last is None else last + datetime.timedelta(minutes=1)
+            frame = complete(self.provider.fetch(self.ticker, start))
+            for row in frame.itertuples(index=False):
+                dt = datetime.datetime.strptime(row.Datetime, '%Y-%m-%d %H:%M:%S')
+                if last is not None and dt <= last: continue
+                last = dt
+                yield dt, row.Open, row.High, row.Low, row.Close, row.Volume
+            self.stopped.wait(self.interval)
+
+    def close(self):
+        self.stopped.set()
+
+
+class StreamData(bt.feed.DataBase):
+    '''
+    Live data feed over any iterable ``source`` of ``(datetime, open, high,
+    low, close, volume)`` bars, read by a background thread and handed to
+    cerebro as they arrive.
+
+    ``arrival`` holds the ``time.perf_counter()`` at which the current bar
+    came out of the source, until a strategy takes it to measure its
+    decision latency. ``qcheck`` bounds how long cerebro blocks on an empty
+    feed, so it is kept short.
+    '''
+    params = (
+        ('source', None),
+        ('timeframe', bt.TimeFrame.Minutes),
+        ('qcheck', 0.05),
+    )
+
+    _ended = object()
+
+    def islive(self):
+        return True
+
+    def haslivedata(self):
+        return not self.queue.empty()
+
+    def start(self):
+        super(StreamData, self).start()
+        self.queue = queue.Queue()
+        self.arrival = None
+        self.ended = False
+        self.thread = threading.Thread(target=self.read, name='stream')
+        self.thread.daemon = True
+        self.thread.start()
+        self.put_notification(self.LIVE)
+
+    def stop(self):
+        super(StreamData, self).stop()
+        if hasattr(self.p.source, 'close'):
+            self.p.source.close()
+
+    def read(self):
+        try:
+            for bar in self.p.source:
+                self.queue.put((time.perf_counter(), bar))
+        finally:
+            self.queue.put(self._ended)
+
+    def _load(self):
+        if self.ended:
+            return False
+        try:
+            item = self.queue.get(timeout=self._qcheck)
+        except queue.Empty:
+            return None
+        if item is self._ended:
+            self.ended = True
+            return False
+
+        self.arrival, (dt, o, h, l, c, v) = item
+        self.lines.datetime[0] = bt.date2num(dt)
+        self.lines.open[0] = o
+        self.lines.high[0] = h
+        self.lines.low[0] = l
+        self.lines.close[0] = c
+        self.lines.volume[0] = v
+        self.lines.openinterest[0] = 0.0
+        return True
+
+
+def replay(tickers, speed=60.0, limit=None, **kwargs):
+    '''
+    Trades ``main.Strategy`` off a replay of the bundled ``<ticker>.csv``
+    files and returns the strategy, whose ``latency`` profiler holds the
+    decision latencies.
+    '''
+    clock = ReplayClock(speed)
+    cerebro = bt.Cerebro()
+    cerebro.broker.setcash(100000)
+    cerebro.addstrategy(main.Strategy, **kwargs)
+    for ticker in tickers:
+        source = ReplaySource('{0}.csv'.format(ticker), clock=clock, limit=limit)
+        cerebro.adddata(StreamData(source=source), name=os.path.basename(ticker))
+    return cerebro.run()[0]
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Trade main.Strategy off a live replay of the bundled bars')
+
+    parser.add_argument('--tickers', nargs='+', default=['AAPL', 'TSLA', 'KO'],
+                        help='Tickers whose <ticker>.csv is replayed')
+
+    parser.add_argument('--speed', type=float, default=60.0,
+                        help='Replay speed, 1 for wall-clock, 0 for no waiting '
+                        '(latencies then include the bars queued up)')
+
+    parser.add_argument('--limit', type=int, default=None,
+                        help='Bars replayed per ticker')
+
+    parser.add_argument('--printlog', action='store_true',
+                        help='Print the trades as they happen')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    replay(args.tickers, speed=args.speed, limit=args.limit, printlog=args.printlog)
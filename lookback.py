@@ -0,0 +1,109 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import numpy as np
+
+
+class LookbackWindow(object):
+    '''
+    Preallocated ring buffer with the last ``size`` bars of some lines of a
+    data feed.
+
+    Every value is written twice, at ``pos`` and ``pos + size``, so the live
+    window is always one contiguous slice and ``get`` hands out NumPy views
+    without copying. ``update`` pulls only the bars added since the last
+    call and refills from the lines when the feed jumped further than the
+    buffer holds.
+    '''
+
+    def __init__(self, data, size, lines=('low', 'high', 'close')):
+        self.data = data
+        self.size = size
+        self.lines = [(getattr(data.lines, name), np.empty(2 * size)) for name in lines]
+        self.buffers = dict(zip(lines, [buf for _, buf in self.lines]))
+        self.pos = 0
+        self.length = None
+
+    def update(self):
+        length = len(self.data)
+        if length == self.length: return self
+
+        if self.length is None or not 0 < length - self.length < self.size:
+            self.fill()
+        else:
+            for ago in range(self.length - length + 1, 1):
+                self.push(ago)
+        self.length = length
+        return self
+
+    def fill(self):
+        for line, buf in self.lines:
+            for i, ago in enumerate(range(1 - self.size, 1)):
+                buf[i] = buf[i + self.size] = line[ago]
+        self.pos = 0
+
+    def push(self, ago=0):
+        pos, size = self.pos, self.size
+        for line, buf in self.lines:
+            buf[pos] = buf[pos + size] = line[ago]
+        self.pos = (pos + 1) % size
+
+    def get(self, name, ago=0, size=None):
+        '''
+        View of the ``size`` values ending ``ago`` bars back (``0`` being the
+        current bar), oldest first. Defaults to every value up to ``ago``.
+        '''
+        if size is None: size = self.size + ago
+        end = self.pos + self.size + ago
+        return self.buffers[name][end - size:end]
+
+
+class LookbackMatrix(object):
+    '''
+    ``LookbackWindow`` over several data feeds at once: the last ``size``
+    bars of every feed as one row of a ``(feeds, size)`` matrix per line,
+    oldest first, so they can be worked on with array operations.
+
+    On every ``update`` the rows of the feeds that moved on by one bar
+    shift left and take the new bar; feeds which jumped further are
+    refilled from their lines and the ones which did not move are left
+    alone.
+    '''
+
+    def __init__(self, datas, size, lines=('low', 'high', 'close')):
+        self.datas = datas
+        self.size = size
+        self.lines = [[getattr(data.lines, name) for data in datas] for name in lines]
+        self.buffers = dict((name, np.empty((len(datas), size))) for name in lines)
+        self.matrices = [self.buffers[name] for name in lines]
+        self.lengths = np.full(len(datas), -size, dtype=int)
+
+    def update(self):
+        lengths = np.array([len(data) for data in self.datas])
+        moved = lengths - self.lengths
+        if (moved == 1).all():
+            for lines, matrix in zip(self.lines, self.matrices):
+                matrix[:, :-1] = matrix[:, 1:]
+                matrix[:, -1] = [line[0] for line in lines]
+        else:
+            for row in np.flatnonzero(moved):
+                self.fill(row, min(int(moved[row]), self.size) if moved[row] > 0 else self.size)
+        self.lengths = lengths
+        return self
+
+    def fill(self, row, count):
+        for lines, matrix in zip(self.lines, self.matrices):
+            line = lines[row]
+            matrix[row, :-count] = matrix[row, count:]
+            matrix[row, -count:] = [line[ago] for ago in range(1 - count, 1)]
+
+    def get(self, name, ago=0, size=None):
+        '''
+        View of the ``size`` columns ending ``ago`` bars back (``0`` being
+        the current bar). Defaults to every column up to ``ago``.
+        '''
+        if size is None: size = self.size + ago
+        end = self.size + ago
+        return self.buffers[name][:, end - size:end]
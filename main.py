@@ -3,50 +3,142 @@ from __future__ import (absolute_import,
                         print_function,
                         unicode_literals)
 
-import yfinance as yf
-import pandas as pd
+import time
 
-import trendln as tl
+import numpy as np
 import backtrader as bt
 
-class Strategy(bt.Strategy):
+from basestrategy import BaseStrategy
+from fastcsv import FastGenericCSVData
+from fitcache import FitCache
+from indicators import HigherTimeframe, TrendlineSignal, buyconfidence, sellconfidence
+from journal import ConsoleSink, Journal, dataname
+from lookback import LookbackMatrix, LookbackWindow
+from results import Recorder, ResultsStore, collect
+from trendlines import BatchSupportResistance, RollingSupportResistance
+
+# The tickers downloaded and backtested when run as a script
+TICKERS = ['AAPL', 'FB', 'MSFT', 'GOOG', 'TSLA', '^GSPC', 'AMZN',
+           'V', 'JNJ', 'WMT', 'JPM', 'PG', 'MA', 'DIS', 'IBM',
+           'NVDA', 'BMY', 'CRM', 'PYPL', 'KO', 'DO', 'INTC']
+
+class Strategy(BaseStrategy):
     params = (
         ('timeframe', 60),
-        ('printlog', True)
+        ('rolling', True),
+        ('checkfits', False),
+        ('precompute', False),
+        ('batched', False),
+        ('lazy', True),
+        ('threshold', 2.0),
+        ('closeweight', 0.5),
+        ('price', 4500),
+        ('confirm', ()),
+        ('confirmbars', 20),
+        ('confirmweight', 0.5),
     )
 
     wins = 0
     loses = 0
 
-    def log(self, data, txt, doprint=False):
-        if self.params.printlog or doprint:
-            datetime = data.datetime
-            date = datetime.date(0)
-            time = datetime.time(0)
-            print('%s, %s, %s' % (date, time, txt))
+    def __init__(self):
+        super(Strategy, self).__init__()
+        length, cache = self.params.timeframe - 1, self.params.fitcache
+        # the feeds resampled for ``confirm`` (multitimeframe.resample) are
+        # not traded, only scored
+        self.traded = [data for data in self.datas
+                       if not any(getattr(data, 'data', None) is other for other in self.datas)]
+        self.layers = [HigherTimeframe(data, self.params.confirmbars, fitcache=cache)
+                       for data in self.datas if not any(data is traded for traded in self.traded)]
+        self.confirms = [[layer for layer in self.layers if layer.data.data is data] for data in self.traded]
+        confirm = sorted(set(self.params.confirm))
+        for data, layers in zip(self.traded, self.confirms):
+            resampled = sorted(set(layer.compression for layer in layers))
+            if resampled != confirm:
+                raise ValueError('confirm={0} but {1} is resampled to {2} times its bar size; add it resampled '
+                                 'to each of confirm with multitimeframe.resample'.format(
+                                     tuple(self.params.confirm), dataname(data), resampled))
+        self.closefits = [RollingSupportResistance(length, check=self.params.checkfits, cache=cache) for _ in self.traded]
+        self.lhfits = [RollingSupportResistance(length, check=self.params.checkfits, cache=cache) for _ in self.traded]
+        self.windows = [LookbackWindow(data, self.params.timeframe + 1) for data in self.traded]
+        self.lookback = self.params.timeframe + 1
+        if self.params.precompute:
+            self.signals = [TrendlineSignal(data, timeframe=self.params.timeframe, closeweight=self.params.closeweight,
+                                            fitcache=self.params.fitcache, profiler=self.profiler)
+                            for data in self.traded]
+        elif self.params.batched:
+            self.matrix = LookbackMatrix(self.traded, self.params.timeframe + 1)
+            # rows of the close windows followed by the ones of the low/high windows
+            self.batch = BatchSupportResistance(2 * len(self.traded), length, cache=cache)
 
     def next(self):
         if len(self) < self.params.timeframe: return
+        if not self.evaluate(): return
 
-        for dataindex, data in enumerate(self.datas):
-            hasOrder = False
-            for order in self.broker.get_orders_open():
-                if order.data == data: hasOrder = True
-            if hasOrder: continue
+        if not self.params.precompute and self.params.batched:
+            confidences = self.batchconfidence()
 
-            lowdata = []
-            highdata = []
-            closedata = []
+        for dataindex, data in enumerate(self.traded):
+            if self.hasorder(data):
+                self.profiler.count('pending', dataindex)
+                continue
+            self.evaluations += 1
 
-            for i in range(-self.params.timeframe, 1):
-                lowdata.append(data.low[i])
-                highdata.append(data.high[i])
-                closedata.append(data.close[i])
+            position = self.getposition(data=data, broker=self.broker)
+            if self.params.precompute:
+                with self.profile('signal', dataindex):
+                    buyConfidence = self.signals[dataindex].buy[0]
+                    sellConfidence = self.signals[dataindex].sell[0]
+                buyConfirm, sellConfirm = self.confirmation(dataindex, data)
+                buyConfidence += buyConfirm
+                sellConfidence += sellConfirm
+            elif self.params.batched:
+                buyConfidence, sellConfidence = confidences[dataindex]
+            else:
+                buyConfidence, sellConfidence = self.confidence(dataindex, data, position)
+
+            if buyConfidence < self.params.threshold and sellConfidence < self.params.threshold: continue
+
+            shouldBuy = buyConfidence >= sellConfidence and not position
+            shouldSell = sellConfidence >= buyConfidence and position
 
-            (_, c_pmin, c_mintrend, _), (_, c_pmax, c_maxtrend, _) = tl.calc_support_resistance(closedata[:self.params.timeframe-1])
-            (_, lh_pmin, lh_mintrend, _), (_, lh_pmax, lh_maxtrend, _) = tl.calc_support_resistance((lowdata[:self.params.timeframe-1],
+            if shouldBuy:
+                with self.profile('order', dataindex):
+                    self.buy(data=data, price=self.params.price)
+                self.log(data, 'Bought data #{0} for {1}'.format(dataindex, data.close[0]))
+            elif shouldSell:
+                with self.profile('order', dataindex):
+                    self.sell(data=data, size=position.size)
+                self.log(data, 'Sold data #{0} for {1}'.format(dataindex, data.close[0]))
+
+    def sides(self, position):
+        '''
+        The sides to score, buy (``True``) and/or sell, in the order they are
+        needed. Flat only a buy can follow, which takes a buy confidence
+        reaching the threshold and at least the sell one; holding the same
+        goes for a sell. So with ``lazy`` the other side is only scored once
+        the first reached the threshold, and left at ``-inf`` otherwise,
+        which leads to the very same decision.
+        '''
+        if not self.params.lazy: return (True, False)
+        return (False, True) if position else (True, False)
+
+    def confidence(self, dataindex, data, position=None):
+        with self.profile('windows', dataindex):
+            window = self.windows[dataindex].update()
+            lowdata = window.get('low')
+            highdata = window.get('high')
+            closedata = window.get('close')
+
+        if self.params.rolling:
+            return self.rollingconfidence(dataindex, data, position, lowdata, highdata, closedata)
+
+        with self.profile('fit', dataindex):
+            (_, c_pmin, c_mintrend, _), (_, c_pmax, c_maxtrend, _) = self.support_resistance(closedata[:self.params.timeframe-1])
+            (_, lh_pmin, lh_mintrend, _), (_, lh_pmax, lh_maxtrend, _) = self.support_resistance((lowdata[:self.params.timeframe-1],
                                                                                                      highdata[:self.params.timeframe-1]))
 
+        with self.profile('predict', dataindex):
             c_buy_sell_prediction = self.buy_sell_prediction(closedata,
                                                              self.params.timeframe,
                                                              c_pmin, c_mintrend,
@@ -56,23 +148,106 @@ class Strategy(bt.Strategy):
                                                               lh_pmin, lh_mintrend,
                                                               lh_pmax, lh_maxtrend)
 
-            buyConfidence = c_buy_sell_prediction[0] / 2.0 + lh_buy_sell_prediction[0]
-            sellConfidence = c_buy_sell_prediction[1] / 2.0 + lh_buy_sell_prediction[1]
-
-            if buyConfidence < 2.0 and sellConfidence < 2.0: continue
-
-            position = self.getposition(data=data, broker=self.broker)
-            shouldBuy = buyConfidence >= sellConfidence and not position
-            shouldSell = sellConfidence >= buyConfidence and position
-
-            if shouldBuy:
-                self.buy(data=data, price=4500)
-                self.log(data, 'Bought data #{0} for {1}'.format(dataindex, closedata[self.params.timeframe]))
-            elif shouldSell:
-                self.sell(data=data, size=position.size)
-                self.log(data, 'Sold data #{0} for {1}'.format(dataindex, closedata[self.params.timeframe]))
+        buyConfirm, sellConfirm = self.confirmation(dataindex, data)
+        buyConfidence = c_buy_sell_prediction[0] * self.params.closeweight + lh_buy_sell_prediction[0] + buyConfirm
+        sellConfidence = c_buy_sell_prediction[1] * self.params.closeweight + lh_buy_sell_prediction[1] + sellConfirm
+        return buyConfidence, sellConfidence
+
+    def rollingconfidence(self, dataindex, data, position, lowdata, highdata, closedata):
+        # fits only the sides asked for by ``sides``
+        timeframe = self.params.timeframe
+        confirm = dict(zip((True, False), self.confirmation(dataindex, data)))
+        with self.profile('fit', dataindex):
+            closefit = self.closefits[dataindex].advance(closedata[:timeframe-1], len(data))
+            lhfit = self.lhfits[dataindex].advance((lowdata[:timeframe-1], highdata[:timeframe-1]), len(data))
+
+        confidences = {}
+        for buy in self.sides(position):
+            with self.profile('fit', dataindex):
+                c_fit = closefit.resistance() if buy else closefit.support()
+                lh_fit = lhfit.resistance() if buy else lhfit.support()
+
+            with self.profile('predict', dataindex):
+                if buy:
+                    c_prediction = self.buy_sell_prediction(closedata, timeframe, None, None, *c_fit)[0]
+                    lh_prediction = self.buy_sell_prediction(closedata, timeframe, None, None, *lh_fit)[0]
+                else:
+                    c_prediction = self.buy_sell_prediction(closedata, timeframe, *(c_fit + (None, None)))[1]
+                    lh_prediction = self.buy_sell_prediction(closedata, timeframe, *(lh_fit + (None, None)))[1]
+
+            confidences[buy] = c_prediction * self.params.closeweight + lh_prediction + confirm[buy]
+            if self.params.lazy and confidences[buy] < self.params.threshold: break
+
+        return confidences.get(True, float('-inf')), confidences.get(False, float('-inf'))
+
+    def confirmation(self, dataindex, data):
+        '''
+        Buy and sell confidence of the current close against the cached
+        fits of the higher timeframes of ``data``, summed over them and
+        weighted by ``confirmweight``, which ``confidence`` adds to its own
+        before the threshold is looked at.
+        '''
+        buyConfidence = sellConfidence = 0.0
+        for layer in self.confirms[dataindex]:
+            with self.profile('confirm', dataindex):
+                fits = layer.fits(data.close[0])
+            if fits is None: continue
+
+            closes, (c_pmin, c_mintrend, c_pmax, c_maxtrend), (lh_pmin, lh_mintrend, lh_pmax, lh_maxtrend) = fits
+            c_prediction = self.buy_sell_prediction(closes, layer.size, c_pmin, c_mintrend, c_pmax, c_maxtrend)
+            lh_prediction = self.buy_sell_prediction(closes, layer.size, lh_pmin, lh_mintrend, lh_pmax, lh_maxtrend)
+            buyConfidence += c_prediction[0] * self.params.closeweight + lh_prediction[0]
+            sellConfidence += c_prediction[1] * self.params.closeweight + lh_prediction[1]
+        return buyConfidence * self.params.confirmweight, sellConfidence * self.params.confirmweight
+
+    def batchconfidence(self):
+        '''
+        ``confidence`` of every data without a pending order in one pass over
+        the windows of all of them per side, as a ``{dataindex: (buy, sell)}``
+        dict.
+        '''
+        length, count = self.params.timeframe - 1, len(self.traded)
+        with self.profile('windows'):
+            rows = [i for i, data in enumerate(self.traded) if not self.hasorder(data)]
+            held = [bool(self.getposition(data=self.traded[row], broker=self.broker)) for row in rows]
+            matrix = self.matrix.update()
+            closes = matrix.get('close', size=length, ago=-2)
+            # rows of the close windows followed by the ones of the low/high windows
+            lows = np.vstack((closes, matrix.get('low', size=length, ago=-2)))
+            highs = np.vstack((closes, matrix.get('high', size=length, ago=-2)))
+            starts = np.tile(matrix.lengths - length, 2)
+            prices = matrix.get('close', size=1)[:, 0]
+
+        confirm = {True: np.zeros(count), False: np.zeros(count)}
+        for row in rows:
+            if self.confirms[row]:
+                confirm[True][row], confirm[False][row] = self.confirmation(row, self.traded[row])
+
+        confidences = {True: np.full(count, float('-inf')), False: np.full(count, float('-inf'))}
+        for step in range(2):
+            for buy in (True, False):
+                todo = [row for row, position in zip(rows, held) if self.sides(position)[step] == buy and
+                        (not step or not self.params.lazy or confidences[not buy][row] >= self.params.threshold)]
+                if not todo: continue
+
+                with self.profile('fit'):
+                    if buy:
+                        lines, trends = self.batch.resistance(highs, starts, todo + [row + count for row in todo])
+                    else:
+                        lines, trends = self.batch.support(lows, starts, todo + [row + count for row in todo])
+
+                with self.profile('predict'):
+                    score = buyconfidence if buy else sellconfidence
+                    n = len(todo)
+                    c_prediction = score(prices[todo], lines[:n], trends[:n], self.params.timeframe)
+                    lh_prediction = score(prices[todo], lines[n:], trends[n:], self.params.timeframe)
+                    confidences[buy][todo] = c_prediction * self.params.closeweight + lh_prediction + confirm[buy][todo]
+
+        buy, sell = confidences[True].tolist(), confidences[False].tolist()
+        return dict((row, (buy[row], sell[row])) for row in rows)
 
     def notify_trade(self, trade):
+        super(Strategy, self).notify_trade(trade)
         if not trade.isclosed: return
 
         if trade.pnl >= 0:
@@ -82,12 +257,24 @@ class Strategy(bt.Strategy):
 
         self.log(trade.data, 'Operation profit: %.2f' % trade.pnl)
 
+    def snapshot(self):
+        state = super(Strategy, self).snapshot()
+        state.update(wins=self.wins, loses=self.loses)
+        return state
+
+    def restore(self, state):
+        super(Strategy, self).restore(state)
+        self.wins, self.loses = state['wins'], state['loses']
+
     def start(self):
+        super(Strategy, self).start()
         print('Start cash: %.2f' % (self.broker.getvalue()))
 
     def stop(self):
         print('End cash: %.2f' % (self.broker.getvalue()))
-        print('Win ratio: %.2f' % (self.wins/(self.wins+self.loses)))
+        if self.wins + self.loses:
+            print('Win ratio: %.2f' % (self.wins/(self.wins+self.loses)))
+        super(Strategy, self).stop()
 
     def buy_sell_prediction(self, dataclose, timeframe, pmin, mintrend, pmax, maxtrend):
         buyConfidence = 0.0
@@ -132,21 +319,16 @@ class Strategy(bt.Strategy):
         return time * slope + intercept
 
 
-def download_data(tickers):
-    filenames = []
-    for ticker in tickers:
-        filename = '{0}.csv'.format(ticker)
-        yf.download(tickers=ticker, period="7d", interval="1m").to_csv(filename)
-        data = pd.read_csv(filename, sep=r'\s*,\s*', header=0, encoding='ascii', engine='python')
-        data['Datetime'] = data['Datetime'].apply(lambda x: str(x)[0:19])
-        data.to_csv(filename, sep=',', header=0, encoding='ascii')
-        filenames.append(filename)
-    return filenames
-def parse_data(filenames):
+def download_data(tickers, provider=None, directory='.'):
+    from downloader import BarStore, Downloader, YahooProvider  # pandas, only when downloading
+    downloader = Downloader(provider or YahooProvider(), BarStore(directory))
+    return downloader.update(tickers)
+def parse_data(filenames, chunksize=None, **kwargs):
     datas = []
     for filename in filenames:
-        datas.append(bt.feeds.GenericCSVData(
+        datas.append(FastGenericCSVData(
             dataname=filename,
+            chunksize=chunksize,
             dtformat=('%Y-%m-%d %H:%M:%S'),
             timeframe=bt.TimeFrame.Minutes,
             datetime=1,
@@ -154,20 +336,28 @@ def parse_data(filenames):
             high=3,
             low=4,
             close=5,
-            volume=7))
+            volume=7,
+            **kwargs))
     return datas
 
 if __name__ == '__main__':
     cerebro = bt.Cerebro()
     cerebro.broker.setcash(100000)
-    strats = cerebro.addstrategy(Strategy)
+    journal = Journal('main-journal.csv', console=ConsoleSink())
+    strats = cerebro.addstrategy(Strategy, fitcache=FitCache('fits.sqlite'), journal=journal)
 
-    filenames = download_data(['AAPL', 'FB', 'MSFT', 'GOOG', 'TSLA', '^GSPC', 'AMZN',
-                               'V', 'JNJ', 'WMT', 'JPM', 'PG', 'MA', 'DIS', 'IBM',
-                               'NVDA', 'BMY', 'CRM', 'PYPL', 'KO', 'DO', 'INTC'])
+    filenames = download_data(TICKERS)
     datas = parse_data(filenames)
 
     for data in datas: cerebro.adddata(data)
+    cerebro.addanalyzer(Recorder)
+
+    start = time.time()
+    strategy = cerebro.run()[0]
+    journal.close()
+    store = ResultsStore('results.sqlite')
+    store.add(collect(strategy, 'main.py', time.time() - start))
+    store.close()
 
-    cerebro.run()
-    cerebro.plot()
\ No newline at end of file
+    from plotting import plot  # imports this module, so not at the top
+    plot(strategy, 'main-plot.png')
\ No newline at end of file
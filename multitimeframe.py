@@ -0,0 +1,79 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import contextlib
+import io
+import time
+
+import backtrader as bt
+
+import main
+
+
+def resample(cerebro, datas, compressions=(5, 15, 60)):
+    '''
+    Adds every feed of ``datas``, already in ``cerebro``, resampled to each
+    of ``compressions`` times its own bar size. Returns the resampled feeds.
+    '''
+    resampled = []
+    for compression in compressions:
+        for data in datas:
+            resampled.append(cerebro.resampledata(data, timeframe=data.p.timeframe,
+                                                  compression=data.p.compression * compression))
+    return resampled
+
+
+def backtest(confirm, tickers, cash=100000.0, **kwargs):
+    '''
+    Runs ``main.Strategy`` quietly, confirmed on ``confirm`` bar sizes if
+    any, returns it and the seconds taken.
+    '''
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(cash)
+    cerebro.addstrategy(main.Strategy, printlog=False, confirm=confirm, **kwargs)
+    datas = main.parse_data(['{0}.csv'.format(ticker) for ticker in tickers])
+    for data in datas:
+        cerebro.adddata(data)
+    resample(cerebro, datas, confirm)
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+    return strategy, time.time() - start
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Backtest main.Strategy with and without confirmation on higher timeframes')
+
+    parser.add_argument('--tickers', nargs='+', default=['AAPL', 'TSLA', 'KO'],
+                        help='Tickers whose <ticker>.csv is backtested')
+
+    parser.add_argument('--confirm', nargs='+', type=int, default=[5, 15, 60],
+                        help='Higher timeframes, in bars of the data')
+
+    parser.add_argument('--strat', required=False, default='',
+                        metavar='kwargs', help='kwargs in key=value format')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    kwargs = eval('dict(' + args.strat + ')')
+    for confirm in ((), tuple(args.confirm)):
+        strategy, seconds = backtest(confirm, args.tickers, **kwargs)
+        print('confirm {0}: pnl {1:.2f}, {2} trades in {3:.1f}s'.format(
+            list(confirm) or 'none', strategy.broker.getvalue() - 100000.0,
+            strategy.wins + strategy.loses, seconds))
+        counts = collections.OrderedDict()
+        for layer in strategy.layers:
+            refits, served = counts.get(layer.compression, (0, 0))
+            counts[layer.compression] = refits + layer.refits, served + layer.served
+        for compression, (refits, served) in counts.items():
+            print('  {0}x: {1} fits, {2} served from cache'.format(compression, refits, served))
@@ -3,55 +3,56 @@ from __future__ import (absolute_import,
                         print_function,
                         unicode_literals)
 
-import yfinance as yf
-import pandas as pd
+import time
 
-import trendln as tl
 import backtrader as bt
 
-class Strategy(bt.Strategy):
+from basestrategy import BaseStrategy
+from fastcsv import FastGenericCSVData
+from fitcache import FitCache
+from indicators import TrendlineSignal
+from journal import ConsoleSink, Journal
+from lookback import LookbackWindow
+from results import Recorder, ResultsStore, collect
+from trendlines import RollingSupportResistance
+
+class Strategy(BaseStrategy):
     params = (
         ('timeframe', 60),
-        ('printlog', True)
+        ('rolling', True),
+        ('checkfits', False),
+        ('precompute', True)
     )
 
     wins = 0
     loses = 0
 
-    def log(self, data, txt, doprint=False):
-        if self.params.printlog or doprint:
-            datetime = data.datetime
-            date = datetime.date(0)
-            time = datetime.time(0)
-            print('%s, %s, %s' % (date, time, txt))
+    def __init__(self):
+        super(Strategy, self).__init__()
+        length, cache = self.params.timeframe - 1, self.params.fitcache
+        self.closefits = [RollingSupportResistance(length, check=self.params.checkfits, cache=cache) for _ in self.datas]
+        self.windows = [LookbackWindow(data, self.params.timeframe + 1) for data in self.datas]
+        self.lookback = self.params.timeframe + 1
+        if self.params.precompute:
+            self.signals = [TrendlineSignal(data, timeframe=self.params.timeframe, scoring='unanimous',
+                                            fitcache=self.params.fitcache, profiler=self.profiler)
+                            for data in self.datas]
 
     def next(self):
         if len(self) < self.params.timeframe: return
+        if not self.evaluate(): return
 
         for dataindex, data in enumerate(self.datas):
-            hasOrder = False
-            for order in self.broker.get_orders_open():
-                if order.data == data: hasOrder = True
-            if hasOrder: continue
-
-            lowdata = []
-            highdata = []
-            closedata = []
-
-            for i in range(-self.params.timeframe, 1):
-                lowdata.append(data.low[i])
-                highdata.append(data.high[i])
-                closedata.append(data.close[i])
-
-            (_, _, c_mintrend, _), (_, _, c_maxtrend, _) = tl.calc_support_resistance(closedata[:self.params.timeframe-1])
-            (_, _, lh_mintrend, _), (_, _, lh_maxtrend, _) = tl.calc_support_resistance((lowdata[:self.params.timeframe-1],
-                                                                                                     highdata[:self.params.timeframe-1]))
-
-            sell_buy_prediction = self.sell_buy_prediction(closedata,
-                                                           closedata,
-                                                           self.params.timeframe,
-                                                           c_mintrend,
-                                                           c_maxtrend)
+            if self.hasorder(data):
+                self.profiler.count('pending', dataindex)
+                continue
+            self.evaluations += 1
+
+            if self.params.precompute:
+                with self.profile('signal', dataindex):
+                    sell_buy_prediction = [self.signals[dataindex].sell[0], self.signals[dataindex].buy[0]]
+            else:
+                sell_buy_prediction = self.prediction(dataindex, data)
 
             position = self.getposition(data=data, broker=self.broker)
 
@@ -59,13 +60,35 @@ class Strategy(bt.Strategy):
             shouldBuy = not position and sell_buy_prediction[1]
 
             if shouldSell:
-                self.sell(data=data, size=position.size)
-                self.log(data, 'Sold data #{0} for {1}'.format(dataindex, closedata[self.params.timeframe]))
+                with self.profile('order', dataindex):
+                    self.sell(data=data, size=position.size)
+                self.log(data, 'Sold data #{0} for {1}'.format(dataindex, data.close[0]))
             elif shouldBuy:
-                self.buy(data=data, price=2000.0)
-                self.log(data, 'Bought data #{0} for {1}'.format(dataindex, closedata[self.params.timeframe]))
+                with self.profile('order', dataindex):
+                    self.buy(data=data, price=2000.0)
+                self.log(data, 'Bought data #{0} for {1}'.format(dataindex, data.close[0]))
+
+    def prediction(self, dataindex, data):
+        with self.profile('windows', dataindex):
+            window = self.windows[dataindex].update()
+            closedata = window.get('close')
+
+        with self.profile('fit', dataindex):
+            if self.params.rolling:
+                _, c_mintrend, _, c_maxtrend = self.closefits[dataindex].update(closedata[:self.params.timeframe-1],
+                                                                                len(data))
+            else:
+                (_, _, c_mintrend, _), (_, _, c_maxtrend, _) = self.support_resistance(closedata[:self.params.timeframe-1])
+
+        with self.profile('predict', dataindex):
+            return self.sell_buy_prediction(closedata,
+                                            closedata,
+                                            self.params.timeframe,
+                                            c_mintrend,
+                                            c_maxtrend)
 
     def notify_trade(self, trade):
+        super(Strategy, self).notify_trade(trade)
         if not trade.isclosed: return
 
         if trade.pnl >= 0:
@@ -75,12 +98,24 @@ class Strategy(bt.Strategy):
 
         self.log(trade.data, 'Operation profit: %.2f' % trade.pnl)
 
+    def snapshot(self):
+        state = super(Strategy, self).snapshot()
+        state.update(wins=self.wins, loses=self.loses)
+        return state
+
+    def restore(self, state):
+        super(Strategy, self).restore(state)
+        self.wins, self.loses = state['wins'], state['loses']
+
     def start(self):
+        super(Strategy, self).start()
         print('Start cash: %.2f' % (self.broker.getvalue()))
 
     def stop(self):
         print('End cash: %.2f' % (self.broker.getvalue()))
-        print('Win ratio: %.2f' % (self.wins/(self.wins+self.loses)))
+        if self.wins + self.loses:
+            print('Win ratio: %.2f' % (self.wins/(self.wins+self.loses)))
+        super(Strategy, self).stop()
 
     def sell_buy_prediction(self, buydata, selldata, timeframe, mintrend, maxtrend):
 
@@ -114,20 +149,14 @@ class Strategy(bt.Strategy):
         return time * slope + intercept
 
 
-def download_data(tickers):
-    filenames = []
-    for ticker in tickers:
-        filename = '{0}.csv'.format(ticker)
-        yf.download(tickers=ticker, period="7d", interval="1m").to_csv(filename)
-        data = pd.read_csv(filename, sep=r'\s*,\s*', header=0, encoding='ascii', engine='python')
-        data['Datetime'] = data['Datetime'].apply(lambda x: str(x)[0:19])
-        data.to_csv(filename, sep=',', header=0, encoding='ascii')
-        filenames.append(filename)
-    return filenames
+def download_data(tickers, provider=None, directory='.'):
+    from downloader import BarStore, Downloader, YahooProvider  # pandas, only when downloading
+    downloader = Downloader(provider or YahooProvider(), BarStore(directory))
+    return downloader.update(tickers)
 def parse_data(filenames):
     datas = []
     for filename in filenames:
-        datas.append(bt.feeds.GenericCSVData(
+        datas.append(FastGenericCSVData(
             dataname=filename,
             dtformat=('%Y-%m-%d %H:%M:%S'),
             timeframe=bt.TimeFrame.Minutes,
@@ -142,7 +171,8 @@ def parse_data(filenames):
 if __name__ == '__main__':
     cerebro = bt.Cerebro()
     cerebro.broker.setcash(10000.0)
-    strats = cerebro.addstrategy(Strategy)
+    journal = Journal('new_try-journal.csv', console=ConsoleSink())
+    strats = cerebro.addstrategy(Strategy, fitcache=FitCache('fits.sqlite'), journal=journal)
 
     filenames = download_data(['AAPL', 'FB', 'MSFT', 'GOOG', 'TSLA', '^GSPC', 'AMZN',
                                'V', 'JNJ', 'WMT', 'JPM', 'PG', 'MA', 'DIS', 'IBM',
@@ -150,6 +180,14 @@ if __name__ == '__main__':
     datas = parse_data(filenames)
 
     for data in datas: cerebro.adddata(data)
+    cerebro.addanalyzer(Recorder)
+
+    start = time.time()
+    strategy = cerebro.run()[0]
+    journal.close()
+    store = ResultsStore('results.sqlite')
+    store.add(collect(strategy, 'new_try.py', time.time() - start))
+    store.close()
 
-    cerebro.run()
-    cerebro.plot()
+    from plotting import plot  # imports this module, so not at the top
+    plot(strategy, 'new_try-plot.png')
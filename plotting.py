@@ -0,0 +1,207 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import contextlib
+import io
+import multiprocessing
+import time
+
+import numpy as np
+
+import backtrader as bt
+
+import main
+from results import Recorder, ticker
+
+
+def lttb(x, y, points):
+    '''
+    Indices of the ``points`` of ``(x, y)`` that Largest-Triangle-Three-
+    Buckets keeps: the first, the last and from each of the buckets in
+    between the point making the largest triangle with the one kept before
+    and the mean of the next bucket. Peaks and troughs survive where
+    taking every nth point would drop them. All indices if there are not
+    more than ``points``.
+    '''
+    n = len(x)
+    if n <= points or points < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    meanx = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    meany = np.add.reduceat(y[:-1], edges[:-1]) / counts
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    last = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        if bucket + 1 < points - 2:
+            nextx, nexty = meanx[bucket + 1], meany[bucket + 1]
+        else:
+            nextx, nexty = x[-1], y[-1]
+        area = np.abs((x[last] - nextx) * (y[lo:hi] - y[last]) - (x[last] - x[lo:hi]) * (nexty - y[last]))
+        last = lo + int(np.argmax(area))
+        kept[bucket + 1] = last
+    return kept
+
+
+def values(line):
+    '''The values of ``line`` up to the current bar, as an array.'''
+    array = line.array
+    if isinstance(array, collections.deque):  # qbuffer: only what is kept
+        return np.asarray(array, dtype=np.float64)
+    return np.frombuffer(array, dtype=np.float64)[:line.idx + 1].copy()
+
+
+def points(line, size):
+    '''
+    ``(x, y)`` of the values of ``line`` which are not NaN, x counted on a
+    clock of ``size`` bars ending on the same bar.
+    '''
+    y = values(line)
+    x = np.flatnonzero(~np.isnan(y))
+    return x + size - len(y), y[x]
+
+
+def series(strategy, tickers=None):
+    '''
+    What ``render`` draws of the finished run of ``strategy``, as plain
+    arrays on the bars of its clock: the close of every feed, or of the
+    ones of ``tickers``, with the buys and sells of its ``BuySell``
+    observer and the portfolio value of the ``Broker`` observer or, if
+    there is none, of a ``Recorder``.
+    '''
+    clock = values(strategy.lines.datetime)
+    feeds = collections.OrderedDict()
+    for data in getattr(strategy, 'traded', strategy.datas):
+        name = ticker(data)
+        if tickers and name not in tickers:
+            continue
+        dtnums = values(data.lines.datetime)
+        x = np.searchsorted(clock, dtnums)
+        found = x < len(clock)
+        found[found] = clock[x[found]] == dtnums[found]
+        feeds[name] = dict(x=x[found], close=values(data.lines.close)[found], buys=None, sells=None)
+
+    value = None
+    # observers added per data are only kept in lists under their name
+    multi = [observer for item in vars(strategy.stats).values() if isinstance(item, list) for observer in item]
+    for observer in list(strategy.observers) + multi:
+        if isinstance(observer, bt.observers.Broker):
+            value = points(observer.lines.value, len(clock))
+        elif isinstance(observer, bt.observers.BuySell) and ticker(observer.data) in feeds:
+            for side in ('buys', 'sells'):
+                feeds[ticker(observer.data)][side] = points(getattr(observer.lines, side[:-1]), len(clock))
+    if value is None:
+        for analyzer in strategy.analyzers:
+            if isinstance(analyzer, Recorder) and analyzer.equity:
+                dtnums, y = map(np.asarray, zip(*analyzer.equity))
+                value = np.minimum(np.searchsorted(clock, dtnums), len(clock) - 1), y
+    return dict(clock=clock, feeds=feeds, value=value)
+
+
+def render(series, path, width=1600, dpi=100):
+    '''
+    Draws ``series`` to ``path``, one panel per feed under the portfolio
+    value, every line reduced by ``lttb`` to one point per pixel of
+    ``width``. ``.html`` makes a page with the chart inlined as SVG, any
+    other extension is left to matplotlib (``.png``, ``.svg``, ``.pdf``).
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import FuncFormatter
+
+    clock, feeds, value = series['clock'], series['feeds'], series['value']
+    panels = ([('value', value, None, None)] if value is not None else []) + [
+        (name, (feed['x'], feed['close']), feed['buys'], feed['sells']) for name, feed in feeds.items()]
+    if not panels:
+        raise ValueError('nothing to plot')
+
+    fig, axes = plt.subplots(len(panels), 1, sharex=True, squeeze=False,
+                             figsize=(width / dpi, 1.0 + 1.8 * len(panels)), dpi=dpi)
+    for ax, (name, (x, y), buys, sells) in zip(axes[:, 0], panels):
+        kept = lttb(x.astype(np.float64), y, width)
+        ax.plot(x[kept], y[kept], linewidth=0.8, color='black' if name == 'value' else 'tab:blue')
+        for marks, marker, color in ((buys, '^', 'tab:green'), (sells, 'v', 'tab:red')):
+            if marks is not None and len(marks[0]):
+                ax.scatter(marks[0], marks[1], marker=marker, color=color, s=12, zorder=3)
+        ax.set_ylabel(name)
+        ax.grid(True, linewidth=0.3)
+
+    def label(x, _):
+        return bt.num2date(clock[int(x)]).strftime('%m-%d %H:%M') if 0 <= x < len(clock) else ''
+
+    axes[-1, 0].xaxis.set_major_formatter(FuncFormatter(label))
+    axes[-1, 0].set_xlim(0, max(1, len(clock) - 1))
+    fig.tight_layout()
+
+    if path.lower().endswith('.html'):
+        svg = io.StringIO()
+        fig.savefig(svg, format='svg')
+        with open(path, 'w') as f:
+            f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{0}</title></head>'
+                    '<body>\n{1}\n</body></html>\n'.format(', '.join(feeds), svg.getvalue()))
+    else:
+        fig.savefig(path)
+    plt.close(fig)
+
+
+def plot(strategy, path, tickers=None, width=1600, dpi=100):
+    '''
+    Non-blocking replacement of ``cerebro.plot()``: takes the ``series`` of
+    ``strategy`` and renders them to ``path`` in another process. Returns
+    the started process; the interpreter waits for it on exit, ``join`` it
+    to wait before.
+    '''
+    process = multiprocessing.Process(target=render, args=(series(strategy, tickers), path, width, dpi))
+    process.start()
+    return process
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Backtest main.Strategy and plot it decimated to a file')
+
+    parser.add_argument('--tickers', nargs='+', default=['AAPL', 'TSLA', 'KO'],
+                        help='Tickers whose <ticker>.csv is backtested')
+
+    parser.add_argument('--plot', nargs='+', default=None,
+                        help='Tickers to plot (default: all backtested)')
+
+    parser.add_argument('--out', default='plot.png',
+                        help='File the chart is written to, .png, .svg, .pdf or .html')
+
+    parser.add_argument('--width', type=int, default=1600,
+                        help='Width in pixels, also the points each line is reduced to')
+
+    parser.add_argument('--strat', required=False, default='',
+                        metavar='kwargs', help='kwargs in key=value format')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    cerebro = bt.Cerebro()
+    cerebro.broker.setcash(100000)
+    cerebro.addstrategy(main.Strategy, printlog=False, **eval('dict(' + args.strat + ')'))
+    for data in main.parse_data(['{0}.csv'.format(ticker) for ticker in args.tickers]):
+        cerebro.adddata(data)
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+    print('Backtest: {0:.1f}s'.format(time.time() - start))
+
+    start = time.time()
+    process = plot(strategy, args.out, tickers=args.plot, width=args.width)
+    print('Handed over to the plotting process in {0:.2f}s'.format(time.time() - start))
+    process.join()
+    print('{0} written in {1:.1f}s'.format(args.out, time.time() - start))
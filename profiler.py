@@ -0,0 +1,123 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import array
+import collections
+import json
+import time
+
+import numpy as np
+
+
+class _Timer(object):
+    __slots__ = ('samples', 'start')
+
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.start)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class Profiler(object):
+    '''
+    Timers and counters for the phases of a strategy bar.
+
+    ``with profiler.phase(name, feed):`` records one duration sample of
+    ``name`` for ``feed`` (``None`` for the whole bar). Samples are kept per
+    phase and feed so ``summary`` can give counts, totals and the p50/p99
+    of each.
+    '''
+
+    def __init__(self):
+        self.samples = collections.defaultdict(lambda: array.array(str('d')))
+        self.counters = collections.Counter()
+
+    def phase(self, name, feed=None):
+        return _Timer(self.samples[(name, feed)])
+
+    def add(self, name, feed, seconds):
+        self.samples[(name, feed)].append(seconds)
+
+    def count(self, name, feed=None, n=1):
+        self.counters[(name, feed)] += n
+
+    def wrap(self, name, func):
+        samples = self.samples[(name, None)]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+        return timed
+
+    def summary(self, perfeed=False):
+        '''
+        One dict per phase (and feed with ``perfeed``) with the sample
+        count, total, mean, p50, p99 and max in seconds.
+        '''
+        groups = collections.defaultdict(list)
+        for (name, feed), samples in self.samples.items():
+            groups[(name, feed if perfeed else None)].append(np.frombuffer(samples))
+
+        rows = []
+        for (name, feed), parts in sorted(groups.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            values = np.concatenate(parts)
+            if not len(values): continue
+            p50, p99 = np.percentile(values, [50, 99])
+            rows.append(dict(phase=name, feed=feed, count=len(values), total=float(values.sum()),
+                             mean=float(values.mean()), p50=float(p50), p99=float(p99), max=float(values.max())))
+        return rows
+
+    def report(self):
+        lines = ['{0:<18} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10}'.format(
+            'phase', 'count', 'total s', 'p50 us', 'p99 us', 'max us')]
+        for row in self.summary():
+            lines.append('{0:<18} {1:>8} {2:>10.3f} {3:>10.1f} {4:>10.1f} {5:>10.1f}'.format(
+                row['phase'], row['count'], row['total'], 1e6 * row['p50'], 1e6 * row['p99'], 1e6 * row['max']))
+        counters = collections.Counter()
+        for (name, _), n in self.counters.items():
+            counters[name] += n
+        for name in sorted(counters):
+            lines.append('{0:<18} {1:>8}'.format(name, counters[name]))
+        return '\n'.join(lines)
+
+    def export(self, path):
+        '''Writes the per feed summary and counters as JSON.'''
+        counters = [dict(name=name, feed=feed, count=n) for (name, feed), n in sorted(
+            self.counters.items(), key=lambda item: (item[0][0], str(item[0][1])))]
+        with open(path, 'w') as f:
+            json.dump(dict(phases=self.summary(perfeed=True), counters=counters), f, indent=2)
+
+
+class NullProfiler(object):
+    '''Stands in for ``Profiler`` when profiling is off, recording nothing.'''
+
+    timer = _NullTimer()
+
+    def phase(self, name, feed=None):
+        return self.timer
+
+    def count(self, name, feed=None, n=1):
+        pass
+
+    def wrap(self, name, func):
+        return func
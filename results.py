@@ -0,0 +1,331 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import json
+import numbers
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import backtrader as bt
+
+from journal import dataname
+
+# Strategy params about running rather than trading, left out of the key:
+# the sinks and the ways of computing the same signals
+IGNORED = ('printlog', 'fitcache', 'profile', 'profileout', 'journal', 'journalbars', 'resume',
+           'rolling', 'checkfits', 'precompute', 'batched', 'lazy')
+
+# Ticker of the rows of ``scores`` over the whole portfolio
+PORTFOLIO = '*'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS paramsets (
+    id INTEGER PRIMARY KEY, strategy TEXT, params TEXT, UNIQUE (strategy, params));
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, paramset INTEGER, strategy TEXT, source TEXT, params TEXT, tickers TEXT, created REAL,
+    seconds REAL, cash REAL, value REAL, pnl REAL, trades INTEGER, wins INTEGER, loses INTEGER, winratio REAL);
+CREATE INDEX IF NOT EXISTS runs_paramset ON runs (paramset);
+CREATE TABLE IF NOT EXISTS scores (
+    paramset INTEGER, ticker TEXT, runs INTEGER, trades INTEGER, wins INTEGER, loses INTEGER,
+    pnl REAL, winratio REAL, PRIMARY KEY (paramset, ticker));
+CREATE INDEX IF NOT EXISTS scores_winratio ON scores (ticker, winratio);
+CREATE INDEX IF NOT EXISTS scores_pnl ON scores (ticker, pnl);
+CREATE INDEX IF NOT EXISTS scores_trades ON scores (ticker, trades);
+CREATE TABLE IF NOT EXISTS tickers (
+    run INTEGER, ticker TEXT, trades INTEGER, wins INTEGER, loses INTEGER, pnl REAL, winratio REAL);
+CREATE INDEX IF NOT EXISTS tickers_run ON tickers (run);
+CREATE TABLE IF NOT EXISTS trades (
+    run INTEGER, ticker TEXT, dtopen TEXT, dtclose TEXT, barlen INTEGER, price REAL, pnl REAL, pnlcomm REAL);
+CREATE INDEX IF NOT EXISTS trades_run ON trades (run);
+CREATE INDEX IF NOT EXISTS trades_ticker ON trades (ticker, run);
+CREATE TABLE IF NOT EXISTS equity (run INTEGER, datetime TEXT, value REAL);
+CREATE INDEX IF NOT EXISTS equity_run ON equity (run);
+'''
+
+
+def ticker(data):
+    '''The ticker of a feed, its name without directory and extension.'''
+    return os.path.splitext(os.path.basename(dataname(data)))[0]
+
+
+def normalize(value):
+    '''``value`` with every int made a float, so ``4500`` and ``4500.0`` key alike.'''
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, numbers.Real):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, dict):
+        return dict((name, normalize(item)) for name, item in value.items())
+    return value
+
+
+def key(params):
+    return json.dumps(normalize(params), sort_keys=True, default=str)
+
+
+class Recorder(bt.Analyzer):
+    '''
+    Closed trades and the broker value every ``every`` bars (and on the
+    last one) of a run, kept in lists until ``collect`` takes them.
+    '''
+    params = (
+        ('every', 30),
+    )
+
+    def start(self):
+        self.trades, self.equity = [], []
+        self.bars = 0
+
+    def next(self):
+        if not self.bars % self.p.every:
+            self.sample()
+        self.bars += 1
+
+    def sample(self):
+        self.equity.append((self.strategy.datetime[0], self.strategy.broker.getvalue()))
+
+    def stop(self):
+        if self.bars and (not self.equity or self.equity[-1][0] != self.strategy.datetime[0]):
+            self.sample()
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self.trades.append((ticker(trade.data), trade.dtopen, trade.dtclose, trade.barlen,
+                                trade.price, trade.pnl, trade.pnlcomm))
+
+    def get_analysis(self):
+        return dict(trades=self.trades, equity=self.equity)
+
+
+def collect(strategy, source='', seconds=None):
+    '''
+    The run of ``strategy``, which had a ``Recorder``, as plain data for
+    ``ResultsStore.add``; picklable, so workers can hand it back.
+    '''
+    recorder = [analyzer for analyzer in strategy.analyzers if isinstance(analyzer, Recorder)][0]
+    params = dict((name, normalize(value)) for name, value in strategy.params._getkwargs().items()
+                  if name not in IGNORED)
+    broker = strategy.broker
+    return dict(strategy='{0}.{1}'.format(type(strategy).__module__, type(strategy).__name__),
+                source=source, params=params, tickers=[ticker(data) for data in strategy.datas],
+                created=time.time(), seconds=seconds, cash=broker.startingcash, value=broker.getvalue(),
+                **recorder.get_analysis())
+
+
+class ResultsStore(object):
+    '''
+    SQLite database of backtest runs: their params and outcome (``runs``),
+    the outcome per ticker (``tickers``), every closed trade (``trades``)
+    and the sampled equity curve (``equity``), indexed for the queries
+    below. Every distinct set of params of a strategy (``paramsets``) has
+    the totals of all its runs, per ticker and for the portfolio, kept up
+    to date in ``scores`` as runs come in, so ranking them reads an index
+    instead of adding up all the runs.
+
+    ``add`` only queues a run; a background thread writes the queued runs
+    in one transaction at a time, so recording does not hold the backtests
+    up. ``flush`` waits until everything queued is written. The queries
+    open a connection of their own and can be used from any thread or
+    process, also while runs are being written.
+    '''
+
+    def __init__(self, path='results.sqlite'):
+        self.path = path
+        self.queue = queue.Queue()
+        self.error = None
+        db = sqlite3.connect(path)
+        db.executescript(SCHEMA)
+        db.close()
+        self.writer = threading.Thread(target=self.write, name='results')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def add(self, run):
+        self.queue.put(run)
+
+    def flush(self):
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+
+    def write(self):
+        db = sqlite3.connect(self.path)
+        while True:
+            runs = [self.queue.get()]
+            while True:
+                try:
+                    runs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if self.error is None:
+                    with db:
+                        for run in runs:
+                            if run is not None:
+                                self.insert(db, run)
+            except Exception as e:
+                self.error = e
+            finally:
+                for _ in runs:
+                    self.queue.task_done()
+            if None in runs:
+                break
+        db.close()
+
+    def insert(self, db, run):
+        pertrade = collections.OrderedDict((name, [0, 0, 0.0]) for name in run['tickers'])
+        for trade in run['trades']:
+            counts = pertrade.setdefault(trade[0], [0, 0, 0.0])
+            counts[0 if trade[5] >= 0 else 1] += 1
+            counts[2] += trade[5]
+        wins = sum(counts[0] for counts in pertrade.values())
+        loses = sum(counts[1] for counts in pertrade.values())
+        pnl = run['value'] - run['cash']
+
+        params = key(run['params'])
+        db.execute('INSERT OR IGNORE INTO paramsets (strategy, params) VALUES (?, ?)', (run['strategy'], params))
+        paramset = db.execute('SELECT id FROM paramsets WHERE strategy = ? AND params = ?',
+                              (run['strategy'], params)).fetchone()[0]
+        cursor = db.execute(
+            'INSERT INTO runs (paramset, strategy, source, params, tickers, created, seconds, cash, value, pnl, '
+            'trades, wins, loses, winratio) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (paramset, run['strategy'], run['source'], params, ' '.join(run['tickers']), run['created'],
+             run['seconds'], run['cash'], run['value'], pnl, wins + loses, wins, loses,
+             wins / (wins + loses) if wins + loses else None))
+        runid = cursor.lastrowid
+        db.executemany('INSERT INTO tickers VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       [(runid, name, w + l, w, l, total, w / (w + l) if w + l else None)
+                        for name, (w, l, total) in pertrade.items()])
+        # pnl of scores is the mean over the runs, winratio over all their trades
+        db.executemany(
+            'INSERT INTO scores VALUES (?, ?, 1, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (paramset, ticker) DO UPDATE SET '
+            'pnl = (pnl * runs + excluded.pnl) / (runs + 1), runs = runs + 1, trades = trades + excluded.trades, '
+            'wins = wins + excluded.wins, loses = loses + excluded.loses, '
+            'winratio = CASE WHEN trades + excluded.trades THEN (wins + excluded.wins) * 1.0 / '
+            '(trades + excluded.trades) END',
+            [(paramset, name, w + l, w, l, total, w / (w + l) if w + l else None)
+             for name, (w, l, total) in list(pertrade.items()) + [(PORTFOLIO, (wins, loses, pnl))]])
+        db.executemany('INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       [(runid, name, bt.num2date(dtopen).isoformat(str(' ')),
+                         bt.num2date(dtclose).isoformat(str(' ')), barlen, price, pnl, pnlcomm)
+                        for name, dtopen, dtclose, barlen, price, pnl, pnlcomm in run['trades']])
+        db.executemany('INSERT INTO equity VALUES (?, ?, ?)',
+                       [(runid, bt.num2date(dtnum).isoformat(str(' ')), value) for dtnum, value in run['equity']])
+
+    def query(self, sql, args=()):
+        db = sqlite3.connect(self.path)
+        db.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in db.execute(sql, args)]
+        finally:
+            db.close()
+
+    def top(self, ticker=None, by='winratio', limit=20, mintrades=1, strategy=None):
+        '''
+        Best ``limit`` parameter sets by ``by`` (``winratio``, ``pnl`` or
+        ``trades``), over all the runs made with them, for ``ticker`` or
+        the whole portfolio, leaving out the sets with fewer than
+        ``mintrades`` trades.
+        '''
+        if by not in ('winratio', 'pnl', 'trades'):
+            raise ValueError('by must be winratio, pnl or trades')
+        sql = ('SELECT p.strategy, p.params, s.runs, s.trades, s.winratio, s.pnl '
+               'FROM scores s INDEXED BY scores_{0} JOIN paramsets p ON p.id = s.paramset '
+               'WHERE s.ticker = ? AND s.trades >= ?').format(by)
+        args = [PORTFOLIO if ticker is None else ticker, mintrades]
+        if strategy is not None:
+            sql += ' AND p.strategy = ?'
+            args.append(strategy)
+        return self.query(sql + ' ORDER BY s.{0} DESC LIMIT ?'.format(by), args + [limit])
+
+    def runs(self, limit=20):
+        '''The last ``limit`` runs.'''
+        return self.query('SELECT id, strategy, source, params, tickers, seconds, pnl, trades, winratio '
+                          'FROM runs ORDER BY id DESC LIMIT ?', (limit,))
+
+    def trades(self, run, ticker=None):
+        sql = 'SELECT ticker, dtopen, dtclose, barlen, price, pnl, pnlcomm FROM trades WHERE run = ?'
+        if ticker is None:
+            return self.query(sql, (run,))
+        return self.query(sql + ' AND ticker = ?', (run, ticker))
+
+    def equity(self, run):
+        return self.query('SELECT datetime, value FROM equity WHERE run = ?', (run,))
+
+
+def table(rows):
+    if not rows: return '(no rows)'
+    names = list(rows[0])
+    cells = [['' if row[name] is None else '{0:.4g}'.format(row[name]) if isinstance(row[name], float)
+              else str(row[name]) for name in names] for row in rows]
+    widths = [max(len(name), *[len(line[i]) for line in cells]) for i, name in enumerate(names)]
+    return '\n'.join(' '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip()
+                     for line in [names] + cells)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Query the backtest results store')
+
+    parser.add_argument('--store', default='results.sqlite',
+                        help='SQLite file of the results')
+
+    commands = parser.add_subparsers(dest='command')
+
+    top = commands.add_parser('top', formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                              help='Best parameter sets')
+    top.add_argument('--ticker', default=None, help='Only the trades of this ticker')
+    top.add_argument('--by', choices=['winratio', 'pnl', 'trades'], default='winratio', help='Ranking')
+    top.add_argument('--limit', type=int, default=20, help='Parameter sets shown')
+    top.add_argument('--mintrades', type=int, default=1, help='Trades a set needs to be ranked')
+    top.add_argument('--strategy', default=None, help='Only runs of this strategy, e.g. main.Strategy')
+
+    runs = commands.add_parser('runs', formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                               help='Last runs')
+    runs.add_argument('--limit', type=int, default=20, help='Runs shown')
+
+    trades = commands.add_parser('trades', help='Trades of a run')
+    trades.add_argument('run', type=int)
+    trades.add_argument('--ticker', default=None, help='Only the trades of this ticker')
+
+    equity = commands.add_parser('equity', help='Sampled equity curve of a run')
+    equity.add_argument('run', type=int)
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not os.path.exists(args.store):
+        raise SystemExit('No results store at {0}'.format(args.store))
+    store = ResultsStore(args.store)
+    start = time.time()
+    if args.command == 'top':
+        rows = store.top(args.ticker, by=args.by, limit=args.limit, mintrades=args.mintrades,
+                         strategy=args.strategy)
+    elif args.command == 'trades':
+        rows = store.trades(args.run, args.ticker)
+    elif args.command == 'equity':
+        rows = store.equity(args.run)
+    else:
+        rows = store.runs(getattr(args, 'limit', 20))
+    elapsed = time.time() - start
+    print(table(rows))
+    print('{0} rows in {1:.1f} ms'.format(len(rows), 1000.0 * elapsed))
+    store.close()
@@ -0,0 +1,201 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import datetime
+import importlib
+import os
+import time
+
+# Only what parsing the command line needs is imported up here: the
+# strategy, the feeds and the sinks load what the chosen ones use in runstrat
+
+# --strategy: module, class and the cash its script starts with
+STRATEGIES = {
+    'main': ('main', 'Strategy', 100000.0),
+    'new_try': ('new_try', 'Strategy', 10000.0),
+    'close-minute': ('close-minute', 'St', 10000.0),
+}
+
+
+def getdata(args, **kwargs):
+    '''
+    The feeds of ``--source``, each named after its file:
+
+      - ``csv``: files in the download_data layout, parsed with pandas
+      - ``btcsv``: ``Date,Time,...`` files such as min_data.txt
+      - ``bars``: the columnar store under ``--root``, memory-mapped, the
+        files converted into it first if missing or older (only that
+        loads pandas)
+      - ``download``: the tickers brought up to date from Yahoo first,
+        then as ``csv``
+    '''
+    filenames = args.data or ['{0}.csv'.format(ticker) for ticker in args.tickers]
+    if args.source == 'bars':
+        from columnar import ColumnarData, prepare
+        return [ColumnarData(dataname=store, name=os.path.basename(store), **kwargs)
+                for store in prepare(filenames, args.root)]
+
+    if args.source == 'btcsv':
+        import backtrader as bt
+        from fastcsv import FastBacktraderCSVData
+        return [FastBacktraderCSVData(dataname=filename, timeframe=bt.TimeFrame.Minutes, **kwargs)
+                for filename in filenames]
+
+    import main
+    if args.source == 'download':
+        filenames = main.download_data(args.tickers)
+    return main.parse_data(filenames, **kwargs)
+
+
+def runstrat(args=None):
+    started = time.time()
+    args = parse_args(args)
+    timings = []
+
+    def phase(name):
+        now = time.time()
+        timings.append((name, now - (phase.last if timings else started)))
+        phase.last = now
+
+    import backtrader as bt
+    modname, clsname, cash = STRATEGIES[args.strategy]
+    strategy = getattr(importlib.import_module(modname), clsname)
+    phase('imports')
+
+    cerebro = bt.Cerebro(stdstats=bool(args.plot))
+
+    # Data feed kwargs
+    kwargs = dict()
+
+    # Parse from/to-date
+    dtfmt, tmfmt = '%Y-%m-%d', 'T%H:%M:%S'
+    for a, d in ((getattr(args, x), x) for x in ['fromdate', 'todate']):
+        if a:
+            strpfmt = dtfmt + tmfmt * ('T' in a)
+            kwargs[d] = datetime.datetime.strptime(a, strpfmt)
+
+    # Data feeds
+    for data in getdata(args, **kwargs):
+        cerebro.adddata(data)
+
+    # Broker
+    cerebro.broker.setcash(args.cash if args.cash is not None else cash)
+
+    # Sinks
+    journal = None
+    if args.journal:
+        from journal import ConsoleSink, Journal
+        journal = Journal(args.journal, console=ConsoleSink(args.rate) if args.rate else None)
+
+    if args.store:
+        from results import Recorder
+        cerebro.addanalyzer(Recorder)
+
+    # Strategy
+    skwargs = eval('dict(' + args.strat + ')')
+    if args.quiet:
+        skwargs.setdefault('printlog', False)
+    if args.fitcache:
+        from fitcache import FitCache
+        skwargs.setdefault('fitcache', FitCache(args.fitcache))
+    cerebro.addstrategy(strategy, journal=journal, **skwargs)
+    phase('setup')
+
+    # Execute
+    strat = cerebro.run(**eval('dict(' + args.cerebro + ')'))[0]
+    phase('run')
+
+    if journal is not None:
+        journal.close()
+
+    if args.store:
+        from results import ResultsStore, collect
+        store = ResultsStore(args.store)
+        store.add(collect(strat, 'run.py --strategy {0}'.format(args.strategy), timings[-1][1]))
+        store.close()
+
+    process = None
+    if args.plot:
+        from plotting import plot
+        process = plot(strat, args.plot, tickers=args.plottickers)
+    phase('sinks')
+
+    print('Final value: {0:.2f}'.format(cerebro.broker.getvalue()))
+    if args.timing:
+        print(', '.join('{0} {1:.2f}s'.format(name, seconds) for name, seconds in timings))
+    return process
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=(
+            'Run one of the strategies over cached or downloaded data, '
+            'loading only the modules the chosen options need'
+        )
+    )
+
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='main',
+                        help='Strategy to run')
+
+    parser.add_argument('--source', choices=['csv', 'btcsv', 'bars', 'download'], default='csv',
+                        help='Where the bars come from, see getdata')
+
+    parser.add_argument('--tickers', nargs='+', default=['AAPL', 'TSLA', 'KO'],
+                        help='Tickers whose <ticker>.csv is used')
+
+    parser.add_argument('--data', nargs='+', default=None,
+                        help='Files to use instead of the tickers, e.g. min_data.txt')
+
+    parser.add_argument('--root', default='bars',
+                        help='Directory of the columnar store of --source bars')
+
+    # Defaults for dates
+    parser.add_argument('--fromdate', required=False, default='',
+                        help='Date[time] in YYYY-MM-DD[THH:MM:SS] format')
+
+    parser.add_argument('--todate', required=False, default='',
+                        help='Date[time] in YYYY-MM-DD[THH:MM:SS] format')
+
+    parser.add_argument('--cash', type=float, default=None,
+                        help='Starting cash (default: the one of the strategy script)')
+
+    parser.add_argument('--cerebro', required=False, default='',
+                        metavar='kwargs', help='kwargs in key=value format')
+
+    parser.add_argument('--strat', required=False, default='',
+                        metavar='kwargs', help='kwargs in key=value format')
+
+    parser.add_argument('--quiet', action='store_true',
+                        help='Do not print the strategy log')
+
+    parser.add_argument('--fitcache', required=False, default='',
+                        help='SQLite file to memoize the trendline fits in')
+
+    parser.add_argument('--journal', required=False, default='',
+                        help='Record bars and messages to this CSV/SQLite file '
+                        'instead of printing them')
+
+    parser.add_argument('--rate', required=False, default=0, type=float,
+                        help='Console lines per second when journaling')
+
+    parser.add_argument('--store', required=False, default='',
+                        help='SQLite results store to record the run in, e.g. results.sqlite')
+
+    parser.add_argument('--plot', required=False, default='',
+                        help='File to plot the run to in the background, .png, .svg, .pdf or .html')
+
+    parser.add_argument('--plottickers', nargs='+', default=None,
+                        help='Tickers to plot (default: all)')
+
+    parser.add_argument('--timing', action='store_true',
+                        help='Print the seconds spent importing, setting up, running and in the sinks')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    runstrat()
@@ -26,6 +26,9 @@ import datetime
 
 import backtrader as bt
 
+from fastcsv import FastBacktraderCSVData
+from journal import ConsoleSink, Journal, dataname
+
 
 class St(bt.Strategy):
     params = dict(
@@ -38,6 +41,7 @@ class St(bt.Strategy):
         weekcarry=False,
         monthdays=[],
         monthcarry=True,
+        journal=None,
     )
 
     def __init__(self):
@@ -71,7 +75,16 @@ class St(bt.Strategy):
     def prenext(self):
         self.next()
 
+    def log(self, txt):
+        if self.p.journal is None:
+            print(txt)
+        else:
+            self.p.journal.message(self.data.datetime[0], dataname(self.data), txt)
+
     def next(self):
+        if self.p.journal is not None:
+            self.p.journal.bar(self.data)
+
         _, isowk, isowkday = self.datetime.date().isocalendar()
         txt = '{}, {}, Week {}, Day {}, O {}, H {}, L {}, C {}'.format(
             len(self), self.datetime.datetime(),
@@ -79,20 +92,22 @@ class St(bt.Strategy):
             self.data.open[0], self.data.high[0],
             self.data.low[0], self.data.close[0])
 
-        print(txt)
+        self.log(txt)
 
     def notify_timer(self, timer, when, *args, **kwargs):
-        print('strategy notify_timer with tid {}, when {} cheat {}'.
-              format(timer.p.tid, when, timer.p.cheat))
+        self.log('strategy notify_timer with tid {}, when {} cheat {}'.
+                 format(timer.p.tid, when, timer.p.cheat))
 
         if self.order is None and timer.params.cheat:
-            print('-- {} Create buy order'.format(
+            self.log('-- {} Create buy order'.format(
                 self.data.datetime.datetime()))
             self.order = self.buy()
 
     def notify_order(self, order):
+        if self.p.journal is not None:
+            self.p.journal.order(order)
         if order.status == order.Completed:
-            print('-- {} Buy Exec @ {}'.format(
+            self.log('-- {} Buy Exec @ {}'.format(
                 self.data.datetime.datetime(), order.executed.price))
 
 
@@ -116,7 +131,7 @@ def runstrat(args=None):
             kwargs[d] = datetime.datetime.strptime(a, strpfmt)
 
     # Data feed
-    data0 = bt.feeds.BacktraderCSVData(dataname=args.data0, **kwargs)
+    data0 = FastBacktraderCSVData(dataname=args.data0, **kwargs)
     cerebro.adddata(data0)
 
     # Broker
@@ -125,11 +140,18 @@ def runstrat(args=None):
     # Sizer
     cerebro.addsizer(bt.sizers.FixedSize, **eval('dict(' + args.sizer + ')'))
 
+    # Journal
+    journal = None
+    if args.journal:
+        journal = Journal(args.journal, console=ConsoleSink(args.rate) if args.rate else None)
+
     # Strategy
-    cerebro.addstrategy(St, **eval('dict(' + args.strat + ')'))
+    cerebro.addstrategy(St, journal=journal, **eval('dict(' + args.strat + ')'))
 
     # Execute
     cerebro.run(**eval('dict(' + args.cerebro + ')'))
+    if journal is not None:
+        journal.close()
 
     if args.plot:  # Plot if requested to
         cerebro.plot(**eval('dict(' + args.plot + ')'))
@@ -165,6 +187,13 @@ def parse_args(pargs=None):
     parser.add_argument('--strat', required=False, default='',
                         metavar='kwargs', help='kwargs in key=value format')
 
+    parser.add_argument('--journal', required=False, default='',
+                        help='Record bars and messages to this CSV/SQLite file '
+                        'instead of printing them')
+
+    parser.add_argument('--rate', required=False, default=0, type=float,
+                        help='Console lines per second when journaling')
+
     parser.add_argument('--plot', required=False, default='',
                         nargs='?', const='{}',
                         metavar='kwargs', help='kwargs in key=value format')
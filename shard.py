@@ -0,0 +1,181 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import time
+
+import numpy as np
+
+import backtrader as bt
+
+import main
+
+# What the merged report is not: printed with it
+CAVEATS = '''\
+Not the same as one cerebro over all tickers sharing the cash:
+  - every ticker trades from its own cash, so one cannot draw on what
+    another leaves idle, and an order the allocation cannot cover is
+    rejected even if the portfolio could pay for it
+  - every ticker runs on its own clock: its first signal comes after its
+    own timeframe bars, not the ones of all feeds together, and it is never
+    held back waiting for the others on a gap
+  - the portfolio value adds up the values of the tickers at their last
+    bar at or before each time, so it is only comparable once all have
+    started trading'''
+
+
+class Equity(bt.Analyzer):
+    '''The broker value on every bar and the closed trades, as plain lists.'''
+
+    def start(self):
+        self.datetimes, self.values, self.trades = [], [], []
+
+    def next(self):
+        self.datetimes.append(self.strategy.datetime[0])
+        self.values.append(self.strategy.broker.getvalue())
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self.trades.append((trade.data.datetime[0], trade.data._name, trade.pnl, trade.pnlcomm))
+
+    def get_analysis(self):
+        return dict(datetimes=self.datetimes, values=self.values, trades=self.trades)
+
+
+def backtest(ticker, cash, params):
+    '''Runs ``main.Strategy`` quietly over ``<ticker>.csv`` alone with ``cash``.'''
+    start = time.time()
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(cash)
+    cerebro.addstrategy(main.Strategy, printlog=False, **params)
+    cerebro.addanalyzer(Equity)
+    for data in main.parse_data(['{0}.csv'.format(ticker)]):
+        cerebro.adddata(data, name=ticker)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+
+    result = dict(ticker=ticker, cash=cash, value=cerebro.broker.getvalue(),
+                  wins=strategy.wins, loses=strategy.loses, seconds=time.time() - start)
+    result.update(strategy.analyzers[0].get_analysis())
+    return result
+
+
+def _backtest(args):
+    return backtest(*args)
+
+
+def merge(results):
+    '''
+    Adds the ticker results up into one portfolio: cash, value, wins and
+    loses, all trades in time order and the equity curve over the union of
+    their bars, each ticker counting with its last value so far (its cash
+    before its first bar).
+    '''
+    cash = sum(result['cash'] for result in results)
+    datetimes = np.unique(np.concatenate([result['datetimes'] for result in results] + [[]]))
+    equity = np.zeros(len(datetimes))
+    for result in results:
+        values = np.asarray(result['values'] or [result['cash']])
+        rows = np.searchsorted(result['datetimes'], datetimes, side='right') - 1
+        equity += np.where(rows >= 0, values[np.maximum(rows, 0)], result['cash'])
+
+    peak = np.maximum.accumulate(equity) if len(equity) else equity
+    wins = sum(result['wins'] for result in results)
+    loses = sum(result['loses'] for result in results)
+    return dict(cash=cash, value=sum(result['value'] for result in results),
+                wins=wins, loses=loses, winratio=wins / (wins + loses) if wins + loses else None,
+                drawdown=float(((peak - equity) / peak).max()) if len(equity) else 0.0,
+                trades=sorted(trade for result in results for trade in result['trades']),
+                datetimes=datetimes, equity=equity)
+
+
+def run(tickers, cash=100000.0, workers=None, params=None):
+    '''
+    Backtests every ticker on its own with an equal share of ``cash`` over
+    a pool of ``workers`` processes. Returns the results in the order of
+    ``tickers`` and their ``merge``.
+    '''
+    allocation = cash / len(tickers)
+    tasks = [(ticker, allocation, params or {}) for ticker in tickers]
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = dict((result['ticker'], result) for result in pool.imap_unordered(_backtest, tasks))
+    finally:
+        pool.terminate()
+        pool.join()
+    results = [results[ticker] for ticker in tickers]
+    return results, merge(results)
+
+
+def shared(tickers, cash=100000.0, params=None):
+    '''The usual run of all ``tickers`` in one cerebro sharing ``cash``, for comparison.'''
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(cash)
+    cerebro.addstrategy(main.Strategy, printlog=False, **(params or {}))
+    for data in main.parse_data(['{0}.csv'.format(ticker) for ticker in tickers]):
+        cerebro.adddata(data)
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+    return dict(value=cerebro.broker.getvalue(), wins=strategy.wins, loses=strategy.loses)
+
+
+def report(results, portfolio):
+    lines = ['{0:<8} {1:>10} {2:>10} {3:>6} {4:>6} {5:>7}'.format(
+        'ticker', 'cash', 'pnl', 'wins', 'loses', 'seconds')]
+    for result in results:
+        lines.append('{0:<8} {1:>10.2f} {2:>10.2f} {3:>6} {4:>6} {5:>7.1f}'.format(
+            result['ticker'], result['cash'], result['value'] - result['cash'],
+            result['wins'], result['loses'], result['seconds']))
+    lines.append('{0:<8} {1:>10.2f} {2:>10.2f} {3:>6} {4:>6}'.format(
+        'total', portfolio['cash'], portfolio['value'] - portfolio['cash'], portfolio['wins'], portfolio['loses']))
+    if portfolio['winratio'] is not None:
+        lines.append('Win ratio: {0:.2f}'.format(portfolio['winratio']))
+    lines.append('Max drawdown: {0:.3%}'.format(portfolio['drawdown']))
+    return '\n'.join(lines)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Backtest main.Strategy one ticker per process and merge the results')
+
+    parser.add_argument('--tickers', nargs='+', default=main.TICKERS,
+                        help='Tickers whose <ticker>.csv is backtested')
+
+    parser.add_argument('--cash', type=float, default=100000.0,
+                        help='Cash of the portfolio, split equally among the tickers')
+
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: one per core)')
+
+    parser.add_argument('--shared', action='store_true',
+                        help='Also run all tickers in one cerebro sharing the cash, to compare')
+
+    parser.add_argument('--strat', required=False, default='',
+                        metavar='kwargs', help='kwargs in key=value format')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    params = eval('dict(' + args.strat + ')')
+
+    start = time.time()
+    results, portfolio = run(args.tickers, cash=args.cash, workers=args.workers, params=params)
+    print(report(results, portfolio))
+    print('Sharded over {0} workers in {1:.1f}s'.format(
+        args.workers or multiprocessing.cpu_count(), time.time() - start))
+    print(CAVEATS)
+
+    if args.shared:
+        start = time.time()
+        result = shared(args.tickers, cash=args.cash, params=params)
+        print('Shared cash: pnl {0:.2f}, wins {1}, loses {2} in {3:.1f}s'.format(
+            result['value'] - args.cash, result['wins'], result['loses'], time.time() - start))
@@ -0,0 +1,220 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import backtrader as bt
+
+import main
+from columnar import arrayloading
+from fitcache import FitCache
+from results import Recorder, ResultsStore, collect
+
+# Row order of the matrix each feed is stored as in shared memory
+LINES = ('datetime', 'open', 'high', 'low', 'close', 'volume', 'openinterest')
+
+
+class SharedData(arrayloading(bt.feed.DataBase)):
+    '''Data feed over a ``(len(LINES), bars)`` matrix of datetimes and values.'''
+    params = (
+        ('timeframe', bt.TimeFrame.Minutes),
+    )
+
+    def loadarrays(self):
+        matrix = self.p.dataname
+        return matrix[0], dict(zip(LINES[1:], matrix[1:]))
+
+
+def share(filenames):
+    '''
+    Parses ``filenames`` the way ``main.parse_data`` does and copies every
+    feed into a shared memory block. Returns the blocks, to be closed and
+    unlinked by the caller, and the ``(name, shape, ticker)`` the workers
+    attach to.
+    '''
+    blocks, specs = [], []
+    for filename, data in zip(filenames, main.parse_data(filenames)):
+        dtnums, columns = data.loadarrays()
+        shape = (len(LINES), len(dtnums))
+        block = shared_memory.SharedMemory(create=True, size=max(1, 8 * shape[0] * shape[1]))
+        matrix = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        matrix[0] = dtnums
+        for row, name in enumerate(LINES[1:], 1):
+            matrix[row] = columns[name]
+        blocks.append(block)
+        specs.append((block.name, shape, os.path.splitext(os.path.basename(filename))[0]))
+    return blocks, specs
+
+
+_matrices = None
+_fitcache = None
+_record = False
+
+
+def attach(specs, fitcache=None, record=False):
+    global _matrices, _fitcache, _record
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    _matrices = [(ticker, np.ndarray(shape, dtype=np.float64, buffer=block.buf))
+                 for block, (_, shape, ticker) in zip(blocks, specs)]
+    _record = record
+    attach.blocks = blocks  # keeps the mappings alive as long as the worker
+    if fitcache is not None:
+        _fitcache = FitCache(fitcache)
+
+
+def backtest(params, cash=100000.0):
+    '''
+    Runs ``main.Strategy`` with ``params`` over the attached feeds. With
+    ``record`` given to ``attach`` the result carries the run for the
+    results store too, under ``run``.
+    '''
+    start = time.time()
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(cash)
+    cerebro.addstrategy(main.Strategy, printlog=False, fitcache=_fitcache, **params)
+    for ticker, matrix in _matrices:
+        cerebro.adddata(SharedData(dataname=matrix), name=ticker)
+    if _record:
+        cerebro.addanalyzer(Recorder)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+
+    trades = strategy.wins + strategy.loses
+    result = dict(params=params,
+                  value=cerebro.broker.getvalue(),
+                  wins=strategy.wins,
+                  loses=strategy.loses,
+                  trades=trades,
+                  winratio=strategy.wins / trades if trades else None,
+                  seconds=time.time() - start)
+    if _record:
+        result['run'] = collect(strategy, 'sweep.py', result['seconds'])
+    return result
+
+
+def _backtest(args):
+    return backtest(*args)
+
+
+def key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def grid(**values):
+    names = sorted(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*[values[name] for name in names])]
+
+
+def done(path):
+    '''Keys of the combinations already in the results file.'''
+    keys = set()
+    if not os.path.exists(path):
+        return keys
+    with open(path) as f:
+        for line in f:
+            try:
+                keys.add(key(json.loads(line)['params']))
+            except ValueError:
+                pass  # cut short when the last run was killed
+    return keys
+
+
+def sweep(filenames, combos, results, workers=None, cash=100000.0, fitcache=None, store=None):
+    '''
+    Backtests every parameter combination over a pool of ``workers``
+    processes, skipping the ones already in ``results``. Each finished
+    combination is appended to ``results`` as a JSON line right away, so a
+    sweep can be followed with ``tail -f`` and resumed after being stopped.
+    The workers share the fits through a ``FitCache`` at ``fitcache``.
+    With ``store`` every run, its trades and equity curve also go into the
+    ``ResultsStore`` at that path.
+    '''
+    finished = done(results)
+    todo = [params for params in combos if key(params) not in finished]
+    print('{0} combinations, {1} already done'.format(len(combos), len(combos) - len(todo)))
+    if not todo:
+        return
+
+    blocks, specs = share(filenames)
+    recorder = ResultsStore(store) if store else None
+    try:
+        pool = multiprocessing.Pool(workers, initializer=attach, initargs=(specs, fitcache, bool(store)))
+        try:
+            with open(results, 'a') as f:
+                runs = pool.imap_unordered(_backtest, [(params, cash) for params in todo])
+                for count, result in enumerate(runs, 1):
+                    if recorder is not None:
+                        recorder.add(result.pop('run'))
+                    f.write(json.dumps(result) + '\n')
+                    f.flush()
+                    print('[{0}/{1}] {2} value {3:.2f} trades {4} ({5:.1f}s)'.format(
+                        count, len(todo), key(result['params']), result['value'],
+                        result['trades'], result['seconds']))
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+        if recorder is not None:
+            recorder.close()
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Parameter sweep of main.Strategy over all cores')
+
+    parser.add_argument('--tickers', nargs='+', default=['AAPL', 'TSLA', 'KO'],
+                        help='Tickers whose <ticker>.csv is backtested')
+
+    parser.add_argument('--timeframe', nargs='+', type=int, default=[60],
+                        help='Values of the timeframe param')
+
+    parser.add_argument('--threshold', nargs='+', type=float, default=[2.0],
+                        help='Values of the confidence threshold')
+
+    parser.add_argument('--closeweight', nargs='+', type=float, default=[0.5],
+                        help='Values of the weight of the close fit')
+
+    parser.add_argument('--price', nargs='+', type=float, default=[4500.0],
+                        help='Values of the order price')
+
+    parser.add_argument('--cash', type=float, default=100000.0,
+                        help='Starting cash')
+
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: one per core)')
+
+    parser.add_argument('--fitcache', default=None,
+                        help='SQLite file the workers share their trendline fits through')
+
+    parser.add_argument('--results', default='sweep.jsonl',
+                        help='JSON lines file the results are appended to')
+
+    parser.add_argument('--store', default=None,
+                        help='SQLite results store the runs are also written to, e.g. results.sqlite')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    combos = grid(timeframe=args.timeframe, threshold=args.threshold,
+                  closeweight=args.closeweight, price=args.price)
+    sweep(['{0}.csv'.format(ticker) for ticker in args.tickers], combos, args.results,
+          workers=args.workers, cash=args.cash, fitcache=args.fitcache, store=args.store)
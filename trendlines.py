@@ -0,0 +1,425 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import collections
+import math
+
+import numpy as np
+import trendln as tl
+
+# Same finite difference stencils trendln's METHOD_NUMDIFF uses (accuracy 2),
+# as findiff.coefs.coefficients(1, 2) and (2, 2) return them to the last bit.
+# Written out because findiff builds them with sympy, which takes longer to
+# import than the rest of a backtest setup
+_MOM = {
+    'forward': dict(coefficients=[-1.5, 2.0, -0.5], offsets=np.array([0, 1, 2])),
+    'center': dict(coefficients=[-0.5, 0.0, 0.5], offsets=np.array([-1, 0, 1])),
+    'backward': dict(coefficients=[0.5, -2.0, 1.5], offsets=np.array([-2, -1, 0])),
+}
+_MOMACC = {
+    'forward': dict(coefficients=[2.0, -5.0, 4.0, -1.0], offsets=np.array([0, 1, 2, 3])),
+    'center': dict(coefficients=[1.0, -2.0, 1.0], offsets=np.array([-1, 0, 1])),
+    'backward': dict(coefficients=[-0.9999999999999998, 3.9999999999999987, -4.999999999999998,
+                                   1.9999999999999996], offsets=np.array([-3, -2, -1, 0])),
+}
+
+
+def _stencil(coefs, h, x):
+    # applied the way findiff accumulates them so signs and zeros agree exactly
+    if x == 0:
+        scheme = coefs['forward']
+    elif x == len(h) - 1:
+        scheme = coefs['backward']
+    else:
+        scheme = coefs['center']
+    fd = 0.0
+    for w, off in zip(scheme['coefficients'], scheme['offsets']):
+        if abs(1 - w) < 1.0e-14:
+            fd += h[x + off]
+        else:
+            fd += float(w) * h[x + off]
+    return fd
+
+
+def _is_extremum(h, x, isMin):
+    momacc = _stencil(_MOMACC, h, x)
+    if not (momacc > 0 if isMin else momacc < 0): return False
+
+    last = len(h) - 1
+    mom = _stencil(_MOM, h, x)
+    if mom == 0: return True
+    if x != last:
+        momnext = _stencil(_MOM, h, x + 1)
+        if mom > 0 and momnext < 0 and h[x] >= h[x + 1] or mom < 0 and momnext > 0 and h[x] <= h[x + 1]:
+            return True
+    if x != 0:
+        momprev = _stencil(_MOM, h, x - 1)
+        if momprev > 0 and mom < 0 and h[x - 1] < h[x] or momprev < 0 and mom > 0 and h[x - 1] > h[x]:
+            return True
+    return False
+
+
+def _line(pts):
+    xbar, ybar = [sum(x) / len(x) for x in zip(*pts)]
+    xy, xs, xx = 0, 0, 0
+    for x, y in pts:
+        tx, ty = x - xbar, y - ybar
+        xy, xs, xx = xy + tx * ty, xs + tx * tx, xx + x * x
+    m = xy / xs
+    b = ybar - m * xbar
+    return m, b, xs, xx
+
+
+def _bestfit(pts):
+    m, b, xs, xx = _line(pts)
+    ys = sum([(y - (m * x + b)) * (y - (m * x + b)) for x, y in pts])
+    ser = math.sqrt(ys / ((len(pts) - 2) * xs))
+    return m, b, ys, ser, ser * math.sqrt(xx / len(pts))
+
+
+def _trend(idxs, h, fltpct):
+    slopes, trend = [], []
+    for x in range(len(idxs)):
+        slopes.append(sorted(((h[idxs[x]] - h[idxs[y]]) / (idxs[x] - idxs[y]), y) for y in range(x + 1, len(idxs))))
+    for x in range(len(idxs)):
+        curIdxs = [idxs[x]]
+        for _, y in slopes[x]:
+            curIdxs.append(idxs[y])
+            if len(curIdxs) < 3: continue
+            res = _bestfit([(p, h[p]) for p in curIdxs])
+            if res[3] <= fltpct:
+                curIdxs.sort()
+                if len(curIdxs) == 3:
+                    trend.append((curIdxs, res))
+                    curIdxs = list(curIdxs)
+                else: curIdxs, trend[-1] = list(curIdxs), (curIdxs, res)
+            else: curIdxs = [curIdxs[0], curIdxs[-1]]
+    return trend
+
+
+def _merge(idxs, trend, h, fltpct):
+    for x in idxs:
+        lines = sorted((r[0], i) for i, (p, r) in enumerate(trend) if x in p)
+        if len(lines) > 1: curIdxs = list(trend[lines[0][1]][0])
+        for _, i in lines[1:]:
+            curIdxs = sorted(dict.fromkeys(curIdxs + trend[i][0]))
+            res = _bestfit([(p, h[p]) for p in curIdxs])
+            if res[3] <= fltpct: trend[i-1], trend[i], curIdxs = ([], None), (curIdxs, res), list(curIdxs)
+            else: curIdxs = list(trend[i][0])
+    return [t for t in trend if t[0] != []]
+
+
+def _area(pts, m, b, isMin, h):
+    base = pts[0]
+    ser = h[base:pts[-1]+1]
+    return sum([max(0, (m * (x+base) + b) - y if isMin else y - (m * (x+base) + b)) for x, y in enumerate(ser)]) / len(ser)
+
+
+def _overall_line(idxs, h):
+    if len(idxs) <= 1: return [float('nan'), float('nan')]
+    # only the line, _bestfit has no standard error for two points
+    m, b = _line([(x, h[x]) for x in idxs])[:2]
+    return [m, b]
+
+
+def _fittrend(h, idxs, fltpct, isMin):
+    trend = _merge(idxs, _trend(idxs, h, fltpct), h, fltpct)
+    trend = [(pts, res + (_area(pts, res[0], res[1], isMin, h),)) for pts, res in trend]
+    trend.sort(key=lambda val: val[1][5])
+    return trend
+
+
+def _cachedtrend(cache, h, idxs, fltpct, isMin, errpct):
+    if cache is None:
+        return _fittrend(h, idxs, fltpct, isMin)
+    return cache.cached(cache.key(h, 'trend', isMin, errpct), lambda: _fittrend(h, idxs, fltpct, isMin))
+
+
+def _shift(trend, shift):
+    # the trendlines of a window fitted ``shift`` bars earlier, in the x
+    # coordinates of the current one
+    shifted = []
+    for pts, (m, b, ys, ser, _, area) in trend:
+        pts = [p - shift for p in pts]
+        xx = sum([p * p for p in pts])
+        shifted.append((pts, (m, b + m * shift, ys, ser, ser * math.sqrt(xx / len(pts)), area)))
+    return shifted
+
+
+def _stencils(coefs, H):
+    # _stencil for every point of every row of H, in the same order of
+    # operations so the results are bit for bit the same
+    n = H.shape[1]
+    fd = np.empty_like(H)
+    for name, first, last in (('forward', 0, 1), ('center', 1, n - 1), ('backward', n - 1, n)):
+        scheme = coefs[name]
+        acc = 0.0
+        for w, off in zip(scheme['coefficients'], scheme['offsets']):
+            values = H[:, first + off:last + off]
+            if abs(1 - w) < 1.0e-14:
+                acc = acc + values
+            else:
+                acc = acc + float(w) * values
+        fd[:, first:last] = acc
+    return fd
+
+
+def _extrema(H, isMin):
+    # _is_extremum for every point of every row of H
+    momacc = _stencils(_MOMACC, H)
+    mom = _stencils(_MOM, H)
+    found = np.zeros(H.shape, dtype=bool)
+    # x != last
+    m, mn, h, hn = mom[:, :-1], mom[:, 1:], H[:, :-1], H[:, 1:]
+    found[:, :-1] |= (m > 0) & (mn < 0) & (h >= hn) | (m < 0) & (mn > 0) & (h <= hn)
+    # x != 0
+    mp, m, hp, h = mom[:, :-1], mom[:, 1:], H[:, :-1], H[:, 1:]
+    found[:, 1:] |= (mp > 0) & (m < 0) & (hp < h) | (mp < 0) & (m > 0) & (hp > h)
+    found |= mom == 0
+    return found & (momacc > 0 if isMin else momacc < 0)
+
+
+def _overall_lines(H, found):
+    # _overall_line of every row of H through its points in found, summed
+    # in the same order as _line
+    counts = found.sum(axis=1)
+    width = max(int(counts.max()), 1) if len(counts) else 1
+    idxs = np.argsort(~found, axis=1, kind='stable')[:, :width]
+    valid = np.arange(width) < counts[:, None]
+    xs = np.where(valid, idxs, 0).astype(float)
+    ys = np.where(valid, np.take_along_axis(H, idxs, axis=1), 0.0)
+
+    # reducing the first axis of a C-contiguous array adds the rows one
+    # after the other, the order of the Python sums
+    xs, ys, valid = xs.T.copy(), ys.T.copy(), valid.T.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xbar = xs.sum(axis=0) / counts
+        ybar = ys.sum(axis=0) / counts
+        tx = np.where(valid, xs - xbar, 0.0)
+        ty = np.where(valid, ys - ybar, 0.0)
+        m = (tx * ty).sum(axis=0) / (tx * tx).sum(axis=0)
+        b = ybar - m * xbar
+    m[counts <= 1] = np.nan
+    b[counts <= 1] = np.nan
+    return np.column_stack((m, b))
+
+
+class _Side(object):
+    # One side (support or resistance) of a rolling fit over a single series
+
+    def __init__(self, length, isMin, errpct, cache=None):
+        self.length = length
+        self.isMin = isMin
+        self.errpct = errpct
+        self.cache = cache
+        self.values = collections.deque(maxlen=length)
+        self.start = 0
+        self.stable = []
+        self.key = None
+        self.trend = None
+        self.trendstart = 0
+
+    def reset(self, h, start):
+        self.values.clear()
+        self.values.extend(float(v) for v in h)
+        self.start = start
+        h = list(self.values)
+        # points 2..n-3 only see central stencils, so their state never
+        # changes while they stay inside the window
+        self.stable = [start + x for x in range(2, len(h) - 2) if _is_extremum(h, x, self.isMin)]
+        self.key = None
+
+    def push(self, value):
+        self.values.append(float(value))
+        self.start += 1
+        h = list(self.values)
+        newest = len(h) - 3
+        while self.stable and self.stable[0] < self.start + 2:
+            self.stable.pop(0)
+        if newest >= 2 and _is_extremum(h, newest, self.isMin):
+            self.stable.append(self.start + newest)
+
+    def extrema(self, h):
+        n = len(h)
+        head = [x for x in range(min(2, n)) if _is_extremum(h, x, self.isMin)]
+        tail = [x for x in range(max(2, n - 2), n) if _is_extremum(h, x, self.isMin)]
+        return head + [x - self.start for x in self.stable] + tail
+
+    def fit(self):
+        h = list(self.values)
+        idxs = self.extrema(h)
+        fltpct = (max(h) - min(h)) / len(h) * self.errpct
+        key = (tuple(x + self.start for x in idxs), fltpct)
+        if key != self.key:
+            trend = _cachedtrend(self.cache, h, idxs, fltpct, self.isMin, self.errpct)
+            self.key, self.trend, self.trendstart = key, trend, self.start
+            return _overall_line(idxs, h), trend
+
+        # same extrema and tolerance as when last fitted: only the x origin moved
+        return _overall_line(idxs, h), _shift(self.trend, self.start - self.trendstart)
+
+
+class RollingSupportResistance(object):
+    '''
+    Keeps the extrema and trendline state of ``tl.calc_support_resistance``
+    between bars so every new bar only evaluates the points that entered or
+    left the window. ``h`` is either a close series or a ``(low, high)``
+    tuple, exactly as given to trendln. Results come back as
+    ``(pmin, mintrend, pmax, maxtrend)``.
+
+    ``update`` fits both sides. Callers needing only one of them can
+    ``advance`` to the window instead, which just keeps the extrema up to
+    date, and then ask for ``support()`` (``(pmin, mintrend)``) and/or
+    ``resistance()`` (``(pmax, maxtrend)``); each side is fitted once per
+    window, on the first request.
+
+    With ``check=True`` every result is compared against a full trendln
+    refit of the same window and an ``AssertionError`` is raised on mismatch.
+    The trendlines of windows seen before are taken from ``cache``, a
+    ``fitcache.FitCache``, when given.
+    '''
+
+    def __init__(self, length, errpct=0.005, window=125, check=False, rtol=1e-6, cache=None):
+        if length > window:
+            raise ValueError('length must not exceed the trendln window')
+        self.length = length
+        self.errpct = errpct
+        self.check = check
+        self.rtol = rtol
+        self.cache = cache
+        self.end = None
+        self.lowhigh = None
+        self.h = None
+        self.fits = {}
+
+    def reset(self, h, end=0):
+        self.lowhigh = type(h) is tuple
+        lows, highs = h if self.lowhigh else (h, h)
+        start = end - len(lows)
+        self.minside = _Side(self.length, True, self.errpct, self.cache)
+        self.maxside = _Side(self.length, False, self.errpct, self.cache)
+        self.minside.reset(lows, start)
+        self.maxside.reset(highs, start)
+        self.end = end
+        self.fits = {}
+
+    def push(self, value):
+        low, high = value if self.lowhigh else (value, value)
+        self.minside.push(low)
+        self.maxside.push(high)
+        self.end += 1
+        self.fits = {}
+
+    def advance(self, h, end):
+        '''
+        Brings the engine to the window ``h`` whose last point has the
+        absolute bar number ``end``, pushing a single point when the window
+        moved by one bar and refilling it otherwise.
+        '''
+        if self.end is not None and end == self.end + 1 and len(self.minside.values) == self.length:
+            self.push((h[0][-1], h[1][-1]) if self.lowhigh else h[-1])
+        elif end != self.end or (type(h) is tuple) != self.lowhigh:
+            self.reset(h, end)
+        self.h = h
+        return self
+
+    def update(self, h, end):
+        '''``advance`` to the window ``h`` and fit both sides.'''
+        self.advance(h, end)
+        pmin, mintrend = self.support()
+        pmax, maxtrend = self.resistance()
+        return (pmin, mintrend, pmax, maxtrend)
+
+    def support(self):
+        return self.fit(self.minside)
+
+    def resistance(self):
+        return self.fit(self.maxside)
+
+    def fit(self, side):
+        fit = self.fits.get(side.isMin)
+        if fit is None:
+            fit = self.fits[side.isMin] = side.fit()
+            if self.check: self.verify(self.h, side.isMin)
+        return fit
+
+    def verify(self, h, isMin):
+        if 'trendln' not in self.fits:
+            self.fits['trendln'] = tl.calc_support_resistance(h, errpct=self.errpct)
+        (_, pmin, mintrend, _), (_, pmax, maxtrend, _) = self.fits['trendln']
+        expected = (('pmin', pmin), ('mintrend', mintrend)) if isMin else (('pmax', pmax), ('maxtrend', maxtrend))
+        for (name, want), got in zip(expected, self.fits[isMin]):
+            if not self._same(got, want):
+                raise AssertionError('%s differs from trendln refit at bar %d: %r != %r' % (name, self.end, got, want))
+
+    def _same(self, got, want):
+        if isinstance(want, (list, tuple)):
+            if not isinstance(got, (list, tuple)) or len(got) != len(want): return False
+            return all(self._same(g, w) for g, w in zip(got, want))
+        if isinstance(want, int): return got == want
+        if math.isnan(want): return math.isnan(got)
+        return abs(got - want) <= self.rtol * max(1.0, abs(want))
+
+
+class BatchSupportResistance(object):
+    '''
+    ``tl.calc_support_resistance`` over the windows of many series at once,
+    one row of a ``(series, length)`` matrix each, for strategies trading
+    several feeds on the same clock.
+
+    The extrema of every row and their overall lines are found with array
+    operations over the whole matrix. The trendline search itself still
+    runs per row, but only for the rows whose extrema or tolerance changed
+    since their last fit (through ``cache`` when given); the others shift
+    the lines they already have, like ``RollingSupportResistance``.
+    '''
+
+    def __init__(self, count, length, errpct=0.005, window=125, cache=None):
+        if length > window:
+            raise ValueError('length must not exceed the trendln window')
+        self.length = length
+        self.errpct = errpct
+        self.cache = cache
+        # (key, trend, start) of the last fit of every row, per side
+        self.fits = {True: [None] * count, False: [None] * count}
+
+    def update(self, lows, highs, starts, rows):
+        '''
+        Fits the given ``rows`` of ``lows``/``highs`` (the same matrix for a
+        close series), whose first points have the absolute bar numbers
+        ``starts``, and returns their ``(pmin, mintrend, pmax, maxtrend)``.
+        '''
+        if not len(rows): return []
+        pmin, mintrends = self.support(lows, starts, rows)
+        pmax, maxtrends = self.resistance(highs, starts, rows)
+        return list(zip(pmin.tolist(), mintrends, pmax.tolist(), maxtrends))
+
+    def support(self, lows, starts, rows):
+        '''Only the ``(pmin, mintrend)`` side of ``update``, as an array of lines and a list of trends.'''
+        return self.side(lows[rows], starts, rows, True)
+
+    def resistance(self, highs, starts, rows):
+        '''Only the ``(pmax, maxtrend)`` side of ``update``, like ``support``.'''
+        return self.side(highs[rows], starts, rows, False)
+
+    def side(self, H, starts, rows, isMin):
+        found = _extrema(H, isMin)
+        lines = _overall_lines(H, found)
+        fltpcts = (H.max(axis=1) - H.min(axis=1)) / H.shape[1] * self.errpct
+        fits = self.fits[isMin]
+        trends = []
+        for i, row in enumerate(rows):
+            start = int(starts[row])
+            idxs = np.flatnonzero(found[i]).tolist()
+            fltpct = float(fltpcts[i])
+            key = (tuple(x + start for x in idxs), fltpct)
+            last = fits[row]
+            if last is not None and last[0] == key:
+                trends.append(_shift(last[1], start - last[2]))
+                continue
+            trend = _cachedtrend(self.cache, H[i].tolist(), idxs, fltpct, isMin, self.errpct)
+            fits[row] = (key, trend, start)
+            trends.append(trend)
+        return lines, trends
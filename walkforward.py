@@ -0,0 +1,188 @@
+from __future__ import (absolute_import,
+                        division,
+                        print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import contextlib
+import datetime
+import io
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import backtrader as bt
+
+import main
+from columnar import COLUMNS, ArrayData, date2num, prepare, read_bars
+from sweep import grid, key
+
+
+def windows(stores, train, test, step=None):
+    '''
+    Rolling ``(train start, test start, test end)`` day numbers over the
+    days of the stores, ``train`` days to fit on followed by ``test`` to
+    score on, moving on by ``step`` days (``test`` by default).
+    '''
+    days = np.unique(np.concatenate([read_bars(store)[0] // 86400 for store in stores]))
+    step = step or test
+    return [(int(days[start]), int(days[start + train]),
+             int(days[start + train + test]) if start + train + test < len(days) else int(days[-1]) + 1)
+            for start in range(0, len(days) - train - test + 1, step)]
+
+
+def load(stores, begin, end, warm):
+    '''
+    ``(name, timestamps, columns, carried)`` of every store with its bars
+    of the days ``begin`` to ``end`` (excluded) preceded by up to ``warm``
+    bars before them, ``carried`` of them. Only that slice is read off the
+    memory-mapped columns.
+    '''
+    slices = []
+    for store in stores:
+        timestamps, columns = read_bars(store)
+        first, last = np.searchsorted(timestamps, [begin * 86400, end * 86400])
+        start = max(0, first - warm)
+        slices.append((os.path.basename(store), np.array(timestamps[start:last]),
+                       dict((name, np.array(columns[name][start:last])) for name in COLUMNS), first - start))
+    return slices
+
+
+def warmed(slices, cash):
+    '''
+    ``resume`` state of a flat account over ``slices``, so the strategy
+    replays the bars carried before the window without trading on them.
+    ``None`` if there are none.
+    '''
+    if not any(carried for _, _, _, carried in slices): return None
+    datas = {}
+    for name, timestamps, columns, carried in slices:
+        bars = dict((column, values[:carried].tolist()) for column, values in columns.items())
+        bars['datetime'] = date2num(timestamps[:carried]).tolist()
+        datas[name] = dict(position=[0, 0.0], trade=None, orders=[], bars=bars)
+    return dict(cash=cash, datas=datas, wins=0, loses=0)
+
+
+def backtest(slices, params, cash=100000.0):
+    '''Runs ``main.Strategy`` with ``params`` quietly over ``slices``.'''
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(cash)
+    cerebro.addstrategy(main.Strategy, printlog=False, resume=warmed(slices, cash), **params)
+    for name, timestamps, columns, _ in slices:
+        cerebro.adddata(ArrayData(timestamps=timestamps, columns=columns), name=name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+    return dict(params=params, pnl=cerebro.broker.getvalue() - cash,
+                trades=strategy.wins + strategy.loses, wins=strategy.wins)
+
+
+def evaluate(stores, window, combos, cash=100000.0):
+    '''
+    Backtests every combination of ``combos`` on the train days of
+    ``window`` and the one with the best pnl on its test days.
+    '''
+    start = time.time()
+    begin, middle, end = window
+    warm = max(params.get('timeframe', 60) for params in combos) + 1
+    train = load(stores, begin, middle, warm)
+    results = [backtest(train, params, cash) for params in combos]
+    best = max(results, key=lambda result: result['pnl'])
+    test = backtest(load(stores, middle, end, warm), best['params'], cash)
+    return dict(window=window, best=best['params'], train=best['pnl'], test=test['pnl'],
+                trades=test['trades'], wins=test['wins'], seconds=time.time() - start)
+
+
+def _evaluate(args):
+    return evaluate(*args)
+
+
+def run(stores, windows, combos, workers=None, cash=100000.0):
+    '''Evaluates ``windows`` over a pool of ``workers`` processes, in order.'''
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = list(pool.imap(_evaluate, [(stores, window, combos, cash) for window in windows]))
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
+def day(number):
+    return (datetime.date(1970, 1, 1) + datetime.timedelta(days=number)).isoformat()
+
+
+def report(results):
+    lines = ['{0:<10} {1:<10} {2:>10} {3:>10} {4:>6}  {5}'.format(
+        'train', 'test', 'train pnl', 'test pnl', 'trades', 'best params')]
+    for result in results:
+        begin, middle, _ = result['window']
+        lines.append('{0:<10} {1:<10} {2:>10.2f} {3:>10.2f} {4:>6}  {5}'.format(
+            day(begin), day(middle), result['train'], result['test'], result['trades'], key(result['best'])))
+
+    if results:
+        tests = np.array([result['test'] for result in results])
+        trains = np.array([result['train'] for result in results])
+        lines.append('Out of sample pnl: {0:.2f} over {1} windows, {2} profitable, mean {3:.2f} '
+                     '(in sample mean {4:.2f})'.format(tests.sum(), len(tests), np.count_nonzero(tests > 0),
+                                                       tests.mean(), trains.mean()))
+        chosen = collections.Counter(key(result['best']) for result in results)
+        lines.append('Params chosen: ' + ', '.join('{0} x{1}'.format(params, count)
+                                                   for params, count in chosen.most_common()))
+    return '\n'.join(lines)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Walk-forward evaluation of main.Strategy over rolling train/test windows')
+
+    parser.add_argument('--tickers', nargs='+', default=['AAPL', 'TSLA', 'KO'],
+                        help='Tickers whose <ticker>.csv is used')
+
+    parser.add_argument('--files', nargs='+', default=None,
+                        help='Bar files to use instead of the tickers, e.g. min_data.txt')
+
+    parser.add_argument('--train', type=int, default=3,
+                        help='Days the params are chosen on')
+
+    parser.add_argument('--test', type=int, default=1,
+                        help='Days the chosen params are scored on')
+
+    parser.add_argument('--step', type=int, default=None,
+                        help='Days between windows (default: --test)')
+
+    parser.add_argument('--timeframe', nargs='+', type=int, default=[60],
+                        help='Values of the timeframe param')
+
+    parser.add_argument('--threshold', nargs='+', type=float, default=[1.0, 2.0, 3.0],
+                        help='Values of the confidence threshold')
+
+    parser.add_argument('--closeweight', nargs='+', type=float, default=[0.5, 1.0],
+                        help='Values of the weight of the close fit')
+
+    parser.add_argument('--cash', type=float, default=100000.0,
+                        help='Starting cash of every run')
+
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: one per core)')
+
+    parser.add_argument('--root', default='bars',
+                        help='Directory of the columnar store the files are converted into')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    stores = prepare(args.files or ['{0}.csv'.format(ticker) for ticker in args.tickers], args.root)
+    combos = grid(timeframe=args.timeframe, threshold=args.threshold, closeweight=args.closeweight)
+    cuts = windows(stores, args.train, args.test, args.step)
+    print('{0} windows, {1} combinations each'.format(len(cuts), len(combos)))
+
+    start = time.time()
+    results = run(stores, cuts, combos, workers=args.workers, cash=args.cash)
+    print(report(results))
+    print('Done in {0:.1f}s'.format(time.time() - start))